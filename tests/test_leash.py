@@ -61,15 +61,17 @@ def test_thread_safety():
     threads = []
     successes = 0
     failures = 0
+    # One lock shared by every worker; a lock created per increment synchronizes nothing.
+    tally_lock = threading.Lock()
 
     def worker():
         nonlocal successes, failures
         try:
             threaded_tool()
-            with threading.Lock():
+            with tally_lock:
                 successes += 1
         except LeashBudgetExceeded:
-            with threading.Lock():
+            with tally_lock:
                 failures += 1
 
     for _ in range(105):
@@ -13,7 +13,15 @@ from tool_leash import (
     LeashError,
     leash,
 )
-from tool_leash.serialization import deep_search_dict, deep_serialize, estimate_tokens_safely
+from tool_leash._atomic import _FetchAddCounter, _LockedCounter
+from tool_leash.decorator import _TOKEN_BATCH_SIZE
+from tool_leash.serialization import (
+    SAMPLE_THRESHOLD,
+    deep_search_dict,
+    deep_serialize,
+    estimate_tokens_from_raw,
+    estimate_tokens_safely,
+)
 
 # ---------------------------------------------------------------------------
 # Async coroutine path
@@ -131,6 +139,155 @@ def test_sync_generator_hitl_blocks_mid_stream():
         list(safe_stream("DANGER payload"))
 
 
+def test_generator_argument_passed_through_when_nothing_inspects_items():
+    """With only a call budget there is no per-item check, so the stream is not re-wrapped."""
+    budget = Budget(max_calls=1)
+    received = []
+
+    @leash(budget=budget)
+    def consume(stream):
+        received.append(stream)
+        return sum(stream)
+
+    source = (i for i in range(4))
+    assert consume(source) == 6
+    assert received[0] is source
+
+
+def test_input_generator_items_metered_without_hitl():
+    budget = Budget(max_tokens=10_000)
+    before_stream = []
+
+    @leash(budget=budget)
+    def consume(stream) -> None:
+        before_stream.append(budget.tokens_used)
+        for _ in stream:
+            pass
+
+    consume(s for s in ["x" * 40, "y" * 80])
+    output_tokens = estimate_tokens_safely(None)
+    streamed = budget.tokens_used - before_stream[0] - output_tokens
+    assert streamed == estimate_tokens_safely("x" * 40) + estimate_tokens_safely("y" * 80)
+
+
+def test_streamed_tokens_are_charged_in_batches():
+    charges = []
+
+    class RecordingBudget(Budget):
+        __slots__ = ()
+
+        def consume_tokens(self, tokens: int) -> None:
+            charges.append(tokens)
+            super().consume_tokens(tokens)
+
+    budget = RecordingBudget(max_tokens=1_000_000)
+
+    @leash(budget=budget)
+    def stream():
+        yield from ("x" * 40 for _ in range(200))
+
+    assert len(list(stream())) == 200
+    streamed = charges[1:]  # the first charge is the (empty) input payload
+    assert len(streamed) == 4  # three full batches of 64 and the remaining 8 items
+    assert sum(streamed) == 200 * estimate_tokens_safely("x" * 40)
+
+
+def test_batched_stream_stops_on_the_item_that_exceeds_budget():
+    per_item = estimate_tokens_safely("x" * 40)
+    budget = Budget(max_tokens=estimate_tokens_safely({}) + 10 * per_item)
+    received = []
+
+    @leash(budget=budget)
+    def stream():
+        yield from ("x" * 40 for _ in range(200))
+
+    with pytest.raises(LeashBudgetExceeded):
+        for item in stream():
+            received.append(item)
+    assert len(received) == 10
+
+
+@pytest.mark.parametrize("batch_size", [_TOKEN_BATCH_SIZE, 1])
+def test_streams_sharing_a_budget_stop_as_if_unbatched(monkeypatch, batch_size):
+    from tool_leash import decorator
+
+    # With a batch size of 1 every item is charged as it arrives: the unbatched reference.
+    monkeypatch.setattr(decorator, "_TOKEN_BATCH_SIZE", batch_size)
+    budget = Budget(max_tokens=60)
+
+    @leash(budget=budget)
+    def relay(stream):
+        yield from stream
+
+    received = []
+    with pytest.raises(LeashBudgetExceeded):
+        for item in relay(f"item-{i:02d}" for i in range(100)):
+            received.append(item)
+    # The input stream and the re-yielded output each hold tokens in a batch of their own.
+    assert (len(received), budget.tokens_used) == (8, 62)
+    assert not budget._holds
+
+
+@pytest.mark.parametrize("strict", [True, False])
+def test_batched_items_do_not_read_the_shared_counters(strict):
+    reads = []
+
+    class RecordingBudget(Budget):
+        __slots__ = ()
+
+        @property
+        def tokens_used(self) -> int:
+            reads.append(1)
+            return super().tokens_used
+
+    budget = RecordingBudget(max_tokens=1_000_000, strict=strict)
+
+    @leash(budget=budget)
+    def stream():
+        yield from ("x" * 40 for _ in range(200))
+
+    # Other streams open on the same budget must not make each item cost more.
+    idle = [stream() for _ in range(50)]
+    for gen in idle:
+        next(gen)
+    assert len(list(stream())) == 200
+    assert reads == []
+    for gen in idle:
+        gen.close()
+
+
+def test_keyword_generator_argument_is_guarded():
+    policy = CallGuard(restricted_args={"rows": ["DROP"]})
+
+    @leash(hitl=policy)
+    def consume(limit: int, rows=None) -> list:
+        return list(rows)
+
+    assert consume(1, rows=(r for r in ["SELECT 1"])) == ["SELECT 1"]
+    with pytest.raises(CallBlockedError):
+        consume(1, rows=(r for r in ["SELECT 1", "DROP TABLE t"]))
+
+
+def test_guarded_stream_item_serialized_once():
+    dumps = []
+
+    class Row:
+        def model_dump(self):
+            dumps.append(1)
+            return {"query": "SELECT 1"}
+
+    policy = CallGuard(restricted_args={"query": ["DROP"]})
+    budget = Budget(max_tokens=10_000)
+
+    @leash(hitl=policy, budget=budget)
+    def consume(rows) -> None:
+        for _ in rows:
+            pass
+
+    consume(r for r in [Row(), Row()])
+    assert len(dumps) == 2
+
+
 # ---------------------------------------------------------------------------
 # Token-only budget (no call limit)
 # ---------------------------------------------------------------------------
@@ -213,6 +370,81 @@ def test_custom_tokenizer_budget_enforced():
         big()
 
 
+def test_structured_tokenizer_receives_serialized_payload():
+    seen = []
+
+    def structured_tokenizer(payload) -> int:
+        seen.append(payload)
+        return 1
+
+    budget = Budget(max_tokens=10_000)
+
+    @leash(budget=budget, tokenizer_func=structured_tokenizer, tokenizer_expects="structured")
+    def work(x: str) -> dict:
+        return {"echo": x}
+
+    work("hello")
+    assert seen == [{"x": "hello"}, {"echo": "hello"}]
+    assert budget.tokens_used == 2
+
+
+def test_repeated_scalar_inputs_are_tokenized_once():
+    seen = []
+
+    def tokenizer(text: str) -> int:
+        seen.append(text)
+        return 1
+
+    budget = Budget(max_tokens=10_000)
+
+    @leash(budget=budget, tokenizer_func=tokenizer)
+    def compute(a, b):
+        return None
+
+    compute(3, 4)
+    compute(3, 4)
+    compute(True, 4)  # True == 1, but the two must not share a cache entry
+    compute(1, 4)
+    inputs = [text for text in seen if text != "null"]
+    assert inputs == ['{"a": 3, "b": 4}', '{"a": true, "b": 4}', '{"a": 1, "b": 4}']
+    assert budget.tokens_used == 8
+
+
+def test_signed_float_zeros_are_not_shared_in_input_cache():
+    budget = Budget(max_tokens=10_000)
+
+    @leash(budget=budget, tokenizer_func=len)
+    def compute(x):
+        return None
+
+    compute(0.0)
+    after_positive = budget.tokens_used
+    compute(-0.0)
+    # '{"x": -0.0}' is one character longer than '{"x": 0.0}'.
+    assert budget.tokens_used - after_positive == after_positive + 1
+
+
+def test_container_inputs_are_not_cached():
+    seen = []
+
+    def tokenizer(text: str) -> int:
+        seen.append(text)
+        return 1
+
+    @leash(budget=Budget(max_tokens=10_000), tokenizer_func=tokenizer)
+    def work(items):
+        return None
+
+    work([1])
+    work([1])
+    assert seen.count('{"items": [1]}') == 2
+
+
+def test_invalid_tokenizer_expects_rejected():
+    with pytest.raises(ValueError, match="tokenizer_expects"):
+        leash(tokenizer_expects="bytes")  # type: ignore[arg-type]
+
+
 # ---------------------------------------------------------------------------
 # HITL custom validator
 # ---------------------------------------------------------------------------
@@ -263,6 +495,317 @@ def test_hitl_custom_validator_runs_before_restricted_args():
     assert "custom" in calls
 
 
+def test_hitl_custom_validator_outranks_restricted_hit():
+    """The fused serialize+scan walk still lets the custom validator raise first."""
+
+    def reject_everything(args: dict) -> None:
+        raise CallBlockedError(message="custom", tool_name="t", trigger_reason="custom")
+
+    policy = CallGuard(restricted_args={"q": ["DROP"]}, custom_validator=reject_everything)
+
+    @leash(hitl=policy)
+    def run(q: str) -> str:
+        return q
+
+    with pytest.raises(CallBlockedError, match="custom"):
+        run("DROP TABLE t")
+
+
+def test_guard_skips_substrings_shadowed_by_earlier_ones():
+    policy = CallGuard(restricted_args={"q": ["DROP", "DROP TABLE", "rm", "DROP"]})
+    assert policy._matchers["q"].substrings == ("DROP", "rm")
+    # The reported substring is unchanged: "DROP" was always found first.
+    with pytest.raises(CallBlockedError, match="restricted substring 'DROP'"):
+        policy.evaluate_serialized("t", {"q": "DROP TABLE t"})
+    assert policy.restricted_args["q"] == ("DROP", "DROP TABLE", "rm", "DROP")
+
+
+def test_guard_policy_cannot_be_edited_in_place():
+    configured = {"q": ["DROP"]}
+    policy = CallGuard(restricted_args=configured)
+    with pytest.raises(TypeError):
+        policy.restricted_args["cmd"] = ["rm -rf"]  # type: ignore[index]
+    with pytest.raises(AttributeError):
+        policy.restricted_args["q"].append("DELETE")  # type: ignore[attr-defined]
+    # The caller's own dict is copied, so editing it cannot drift from the compiled policy.
+    configured["q"].append("DELETE")
+    assert policy.restricted_args == {"q": ("DROP",)}
+    policy.evaluate_serialized("t", {"q": "DELETE x"})
+
+
+def test_guard_policy_reassignment_recompiles():
+    policy = CallGuard(restricted_args={"q": ["DROP"]}, verdict_cache_size=4)
+    policy.evaluate_serialized("t", {"a": [{"cmd": "rm -rf /"}]})
+    policy.restricted_args = {**policy.restricted_args, "cmd": ["rm -rf"]}
+    for check in (policy.evaluate_serialized, policy.serialize_and_evaluate):
+        with pytest.raises(CallBlockedError, match="argument 'cmd'"):
+            check("t", {"a": [{"cmd": "rm -rf /"}]})
+        with pytest.raises(CallBlockedError, match="argument 'cmd'"):
+            check("t", {"cmd": "rm -rf /"})
+    policy.evaluate_serialized("t", {"q": "drop t"})
+    policy.case_insensitive = True
+    with pytest.raises(CallBlockedError, match="'DROP'"):
+        policy.evaluate_serialized("t", {"q": "drop t"})
+
+
+def test_guard_core_prefilter_keeps_reported_substring():
+    policy = CallGuard(restricted_args={"q": ["DROP TABLE", "rm -rf /", "DROP", "rm"]})
+    assert policy._matchers["q"].cores == ("DROP", "rm")
+    policy.evaluate_serialized("t", {"q": "SELECT 1"})
+    with pytest.raises(CallBlockedError, match="'DROP TABLE'"):
+        policy.evaluate_serialized("t", {"q": "DROP TABLE t"})
+    with pytest.raises(CallBlockedError, match="'DROP'"):
+        policy.evaluate_serialized("t", {"q": "DROP INDEX i"})
+
+
+def test_guard_initials_prefilter_keeps_verdicts():
+    policy = CallGuard(restricted_args={"q": ["DROP", "DELETE", "TRUNCATE", "GRANT"]})
+    assert policy._matchers["q"].initials == ("D", "T", "G")
+    assert CallGuard(restricted_args={"q": ["DROP", "rm"]})._matchers["q"].initials is None
+    policy.evaluate_serialized("t", {"q": "select Data from Tables"})
+    with pytest.raises(CallBlockedError, match="'DELETE'"):
+        policy.evaluate_serialized("t", {"q": "DO DELETE"})
+
+
+def test_guard_interns_restricted_keys():
+    import json
+    import sys
+
+    key = json.loads('"query_text"')
+    policy = CallGuard(restricted_args={key: ["DROP"]})
+    assert next(iter(policy._matchers)) is sys.intern("query_text")
+    assert next(iter(policy.restricted_args)) is key
+    with pytest.raises(CallBlockedError):
+        policy.evaluate_serialized("t", {"a": [{"query_text": "DROP t"}]})
+
+
+def test_guard_length_prefilter_keeps_verdicts():
+    policy = CallGuard(restricted_args={"q": ["DROP TABLE", "rm -rf"]})
+    assert policy._matchers["q"].min_len == 6
+    policy.evaluate_serialized("t", {"q": "rm -r"})
+    with pytest.raises(CallBlockedError, match="'rm -rf'"):
+        policy.evaluate_serialized("t", {"q": "rm -rf"})
+
+
+def test_guard_reports_earliest_restricted_key_first():
+    """All keys are searched in one walk, but the reported hit keeps restricted_args order."""
+    policy = CallGuard(restricted_args={"a": ["X"], "b": ["Y"]})
+    payload = {"b": "Y", "nested": [{"a": "ok"}, {"a": "X"}]}
+    with pytest.raises(CallBlockedError, match="argument 'a'") as exc_info:
+        policy.evaluate_serialized("t", payload)
+    assert exc_info.value.trigger_reason.endswith(": X")
+
+
+def test_shared_subtree_rendered_once_per_evaluation(monkeypatch):
+    from tool_leash import guard
+
+    calls = []
+    real_dumps = guard.json.dumps
+    monkeypatch.setattr(guard.json, "dumps", lambda v: calls.append(v) or real_dumps(v))
+    shared = {"text": "hello"}
+    policy = CallGuard(restricted_args={"query": ["DROP"], "sql": ["DELETE"]})
+    policy.evaluate_serialized("t", {"a": [{"query": shared}], "b": [{"sql": shared}]})
+    assert calls == [shared]
+    policy.evaluate_serialized("t", {"a": [{"query": shared}]})
+    assert calls == [shared, shared]
+
+
+def test_guard_verdict_cache_is_bounded_lru():
+    seen = []
+    policy = CallGuard(
+        restricted_args={"q": ["DROP"]}, custom_validator=seen.append, verdict_cache_size=2
+    )
+    blocked = {"a": [{"q": "DROP t"}]}
+    for _ in range(2):
+        with pytest.raises(CallBlockedError, match="Tool 'run'") as exc_info:
+            policy.evaluate_serialized("run", blocked)
+    # A cached hit is raised as a fresh error under the current tool name.
+    with pytest.raises(CallBlockedError, match="Tool 'other'") as second:
+        policy.evaluate_serialized("other", blocked)
+    assert second.value is not exc_info.value
+    assert seen == [blocked] * 3
+
+    policy.evaluate_serialized("run", {"a": [{"q": "ok 1"}]})
+    policy.evaluate_serialized("run", {"a": [{"q": "ok 2"}]})
+    assert list(policy._verdicts) == [repr({"a": [{"q": "ok 1"}]}), repr({"a": [{"q": "ok 2"}]})]
+    assert CallGuard(restricted_args={"q": ["DROP"]})._verdicts is None
+
+
+def test_guard_verdict_cache_serves_leashed_calls(monkeypatch):
+    searches = []
+    find_violation = CallGuard._find_violation
+
+    def counting_find(self, serialized, matchers):
+        searches.append(serialized)
+        return find_violation(self, serialized, matchers)
+
+    monkeypatch.setattr(CallGuard, "_find_violation", counting_find)
+    policy = CallGuard(restricted_args={"q": ["DROP"]}, verdict_cache_size=10)
+
+    @leash(hitl=policy)
+    def run(rows: list) -> None:
+        pass
+
+    for _ in range(3):
+        run([{"q": "SELECT 1"}])
+    for _ in range(2):
+        with pytest.raises(CallBlockedError, match="'DROP'"):
+            run([{"q": "DROP t"}])
+    assert len(searches) == 2
+    assert len(policy._verdicts) == 2
+
+    # Oversized payloads are searched every time rather than cached.
+    big = [{"q": "x" * 5000}]
+    run(big)
+    run(big)
+    assert len(searches) == 4
+    assert len(policy._verdicts) == 2
+
+
+def test_guard_verdict_cache_size_assignable():
+    policy = CallGuard(restricted_args={"q": ["DROP"]})
+    payloads = [{"a": [{"q": f"ok {i}"}]} for i in range(3)]
+
+    policy.verdict_cache_size = 10
+    for payload in payloads:
+        policy.evaluate_serialized("run", payload)
+    assert len(policy._verdicts) == 3
+    policy.verdict_cache_size = 2
+    assert list(policy._verdicts) == [repr(payloads[1]), repr(payloads[2])]
+    policy.evaluate_serialized("run", payloads[0])
+    assert list(policy._verdicts) == [repr(payloads[2]), repr(payloads[0])]
+    policy.verdict_cache_size = 0
+    assert policy._verdicts is None
+    policy.evaluate_serialized("run", payloads[0])
+
+
+def test_guard_verdict_cache_does_not_render_oversized_payloads(monkeypatch):
+    from tool_leash import guard
+
+    rendered = []
+
+    def recording_repr(obj):
+        rendered.append(obj)
+        return repr(obj)
+
+    monkeypatch.setattr(guard, "repr", recording_repr, raising=False)
+    policy = CallGuard(restricted_args={"q": ["DROP"]}, verdict_cache_size=10)
+    policy.evaluate_serialized("run", {"a": [{"q": "ok"}] * 2000})
+    policy.evaluate_serialized("run", {"text": "x" * 5000, "a": [{"q": "ok"}]})
+    assert rendered == []
+    assert len(policy._verdicts) == 0
+
+
+def test_guard_recompile_during_search_does_not_cache_old_verdict(monkeypatch):
+    policy = CallGuard(restricted_args={"q": ["DROP"]}, verdict_cache_size=10)
+    find_violation = CallGuard._find_violation
+
+    def recompiling_find(self, serialized, matchers):
+        # Another thread tightens the policy while this search is still running.
+        monkeypatch.setattr(CallGuard, "_find_violation", find_violation)
+        policy.restricted_args = {"q": ["TRUNCATE"]}
+        return find_violation(self, serialized, matchers)
+
+    monkeypatch.setattr(CallGuard, "_find_violation", recompiling_find)
+    payload = {"a": [{"q": "TRUNCATE t"}]}
+    policy.evaluate_serialized("run", payload)  # judged by the old policy
+    with pytest.raises(CallBlockedError, match="'TRUNCATE'"):
+        policy.evaluate_serialized("run", payload)
+
+
+def test_large_container_scanned_in_slices(monkeypatch):
+    import json
+
+    from tool_leash import guard
+
+    monkeypatch.setattr(guard, "_JSON_SLICE", 2)
+    rows = [{"q": f"row {i}"} for i in range(7)]
+    mapping = {f"k{i}": [i, True, None] for i in range(5)}
+    for value in (rows, mapping, [], {}):
+        assert "".join(guard._json_slices(value)) == json.dumps(value)
+
+    # '"}, {"' only exists across the boundary between two slices' JSON.
+    policy = CallGuard(restricted_args={"rows": ['row 1"}, {"q']})
+    with pytest.raises(CallBlockedError) as exc_info:
+        policy.evaluate_serialized("t", {"rows": rows})
+    assert exc_info.value.trigger_reason.endswith(json.dumps(rows))
+    CallGuard(restricted_args={"rows": ["DROP"]}).evaluate_serialized("t", {"rows": rows})
+
+
+def test_guard_flat_payload_fast_path():
+    policy = CallGuard(restricted_args={"cmd": ["rm -rf"], "path": ["/etc"]})
+    flat = {"path": "/etc/passwd", "cmd": "rm -rf /", "n": 3}
+    # Reported in restricted_args order on both entry points, like a nested payload.
+    for check in (policy.evaluate_serialized, policy.serialize_and_evaluate):
+        with pytest.raises(CallBlockedError, match="argument 'cmd'"):
+            check("t", flat)
+    safe = {"cmd": "ls", 7: None}
+    assert policy.serialize_and_evaluate("t", safe) == deep_serialize(safe)
+
+
+def test_guard_case_insensitive_matching():
+    assert (
+        CallGuard(restricted_args={"q": ["DROP"]}).evaluate_serialized("t", {"q": "drop t"})
+        is None
+    )
+    policy = CallGuard(restricted_args={"q": ["DROP", "Straße"]}, case_insensitive=True)
+    # The error names the substring as configured, and the trace shows the original value.
+    with pytest.raises(CallBlockedError, match="restricted substring 'DROP'") as exc_info:
+        policy.evaluate_serialized("t", {"q": "drop table t"})
+    assert exc_info.value.trigger_reason.endswith(": drop table t")
+    with pytest.raises(CallBlockedError, match="'Straße'"):
+        policy.serialize_and_evaluate("t", {"q": ["STRASSE 1"]})
+    policy.evaluate_serialized("t", {"q": "select 1"})
+
+
+def test_guard_single_key_flat_check_searches_str_of_scalars():
+    policy = CallGuard(restricted_args={"n": ["42"]})
+    for check in (policy.evaluate_serialized, policy.serialize_and_evaluate):
+        with pytest.raises(CallBlockedError) as exc_info:
+            check("t", {"n": 1423, "m": "42"})
+        assert exc_info.value.trigger_reason.endswith("'n': 1423")
+        check("t", {"m": 42, "n": None})
+
+
+def test_leash_reports_same_violation_as_evaluate_serialized():
+    policy = CallGuard(restricted_args={"a": ["DROP"], "b": ["DROP"], "query": ["DROP"]})
+
+    @leash(hitl=policy)
+    def run(payload: dict, query: object = None) -> None:
+        pass
+
+    cases = [
+        {"payload": {"b": "DROP", "a": "DROP"}, "query": None},
+        {"payload": {}, "query": {"query": "DROP x"}},
+    ]
+    for arguments in cases:
+        with pytest.raises(CallBlockedError) as expected:
+            policy.evaluate_serialized("run", deep_serialize(arguments))
+        with pytest.raises(CallBlockedError) as actual:
+            run(**arguments)
+        assert str(actual.value) == str(expected.value)
+        assert actual.value.trigger_reason == expected.value.trigger_reason
+    with pytest.raises(CallBlockedError, match="argument 'a'"):
+        run({"b": "DROP", "a": "DROP"})
+    with pytest.raises(CallBlockedError) as exc_info:
+        run({}, {"query": "DROP x"})
+    assert exc_info.value.trigger_reason.endswith(': {"query": "DROP x"}')
+
+
+def test_serialize_and_evaluate_returns_serialized_payload():
+    policy = CallGuard(restricted_args={"query": ["DROP"]})
+    payload = {"outer": ({"query": "SELECT 1"},), "n": 1}
+    assert policy.serialize_and_evaluate("t", payload) == deep_serialize(payload)
+    with pytest.raises(CallBlockedError):
+        policy.serialize_and_evaluate("t", {"outer": ({"query": "DROP t"},)})
+
+
+def test_deep_serialize_visitor_sees_completed_entries():
+    seen = []
+    deep_serialize({"a": {"b": 1}, "c": [2]}, visitor=lambda k, v: seen.append((k, v)))
+    assert seen == [("b", 1), ("a", {"b": 1}), ("c", [2])]
+
+
 def test_hitl_no_policy_is_passthrough():
     """No budget, no HITL — decorator is transparent."""
 
@@ -294,6 +837,14 @@ def test_budget_remaining_calls_decrements():
     assert budget.get_remaining_calls() == 2
 
 
+def test_budget_calls_used_read_does_not_consume():
+    budget = Budget(max_calls=3)
+    budget.consume_call()
+    assert budget.calls_used == 1
+    assert budget.calls_used == 1
+    assert budget.get_remaining_calls() == 2
+
+
 def test_budget_remaining_returns_none_when_unlimited():
     budget = Budget()  # no limits
     assert budget.get_remaining_calls() is None
@@ -313,6 +864,146 @@ def test_budget_remaining_tokens_decrements():
     assert budget.get_remaining_tokens() == 10_000 - used
 
 
+@pytest.mark.parametrize("strict", [True, False])
+def test_budget_usage_is_assignable_and_resettable(strict):
+    budget = Budget(max_calls=3, max_tokens=10, strict=strict)
+    budget.consume_call()
+    budget.consume_tokens(4)
+    budget.calls_used = 3
+    assert budget.snapshot() == (3, 4)
+    with pytest.raises(LeashBudgetExceeded):
+        budget.consume_call()
+    budget.tokens_used = 9
+    budget.reset()
+    assert budget.snapshot() == (0, 0)
+    for _ in range(3):
+        budget.consume_call()
+    budget.consume_tokens(10)
+    assert budget.snapshot() == (3, 10)
+
+
+def test_non_strict_budget_counts_unpublished_calls():
+    budget = Budget(max_calls=1000, max_tokens=10_000, strict=False)
+    for _ in range(10):
+        budget.consume_call()
+        budget.consume_tokens(3)
+    assert budget.snapshot() == (10, 30)
+    assert budget.get_remaining_calls() == 990
+    assert budget.get_remaining_tokens() == 9_970
+
+
+def test_non_strict_budget_single_thread_is_exact():
+    budget = Budget(max_calls=5, strict=False)
+    for _ in range(5):
+        budget.consume_call()
+    with pytest.raises(LeashBudgetExceeded, match="max_calls"):
+        budget.consume_call()
+
+
+def test_non_strict_budget_aggregates_threads():
+    import threading
+
+    budget = Budget(max_calls=10_000, strict=False)
+
+    def worker():
+        for _ in range(100):
+            budget.consume_call()
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert budget.calls_used == 800
+
+
+def test_non_strict_budget_enforced_across_short_lived_threads():
+    import gc
+    import threading
+    import weakref
+
+    budget = Budget(max_calls=50, max_tokens=500, strict=False)
+    failures = []
+
+    def worker():
+        try:
+            budget.consume_call()
+            budget.consume_tokens(5)
+        except LeashBudgetExceeded:
+            failures.append(1)
+
+    for _ in range(200):
+        thread = threading.Thread(target=worker)
+        thread.start()
+        thread.join()
+
+    # Each exited thread's tally is published, so the 51st thread is refused.
+    assert len(failures) == 150
+    assert budget.calls_used == 200
+    assert budget._tallies == set()
+
+    # Exit finalizers do not keep a budget used from a long-lived thread alive.
+    scratch = Budget(max_calls=5, strict=False)
+    scratch.consume_call()
+    ref = weakref.ref(scratch)
+    del scratch
+    gc.collect()
+    assert ref() is None
+
+
+@pytest.mark.parametrize("counter_cls", [_FetchAddCounter, _LockedCounter])
+def test_atomic_counters_are_exact_across_threads(counter_cls):
+    import threading
+
+    counter = counter_cls()
+
+    def worker():
+        for _ in range(1000):
+            counter.increment()
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert counter.value == 8000
+    assert counter.increment() == 8001
+
+
+def test_call_only_budget_does_not_serialize_inputs():
+    """Nothing reads the payload without HITL or max_tokens, so it is never walked."""
+    dumps = []
+
+    class Model:
+        def model_dump(self):
+            dumps.append(1)
+            return {"field": "value"}
+
+    budget = Budget(max_calls=2)
+
+    @leash(budget=budget)
+    def op(model):
+        return None
+
+    op(Model())
+    assert dumps == []
+    assert budget.calls_used == 1
+
+
+def test_call_only_budget_does_not_charge_malformed_call():
+    budget = Budget(max_calls=2)
+
+    @leash(budget=budget)
+    def op(x):
+        return x
+
+    with pytest.raises(TypeError):
+        op(1, 2)
+    assert budget.calls_used == 0
+
+
 def test_budget_unlimited_never_raises():
     budget = Budget()  # no max_calls, no max_tokens
 
@@ -339,6 +1030,27 @@ def test_leash_preserves_function_name():
     assert my_named_function.__doc__ == "My docstring."
 
 
+def test_leash_preserves_signature_for_introspection():
+    import inspect
+
+    @leash(budget=Budget(max_calls=1))
+    def search(query: str, limit: int = 10) -> list:
+        return []
+
+    assert str(inspect.signature(search)) == "(query: str, limit: int = 10) -> list"
+    assert search.__qualname__.endswith("search")
+
+
+def test_leash_preserves_function_attributes():
+    def search(query: str) -> str:
+        return query
+
+    search.tool_schema = {"name": "search"}  # type: ignore[attr-defined]
+    leashed = leash(budget=Budget(max_calls=1))(search)
+    assert leashed.tool_schema == {"name": "search"}
+    assert leashed.__wrapped__ is search
+
+
 @pytest.mark.asyncio
 async def test_leash_preserves_async_function_name():
     @leash()
@@ -386,6 +1098,14 @@ def test_budget_exceeded_message_contains_limit():
         op()
 
 
+def test_token_overrun_is_counted_once():
+    budget = Budget(max_tokens=10)
+    budget.consume_tokens(4)
+    with pytest.raises(LeashBudgetExceeded, match=r"consuming 8 tokens .* currently used: 12\."):
+        budget.consume_tokens(8)
+    assert budget.tokens_used == 12
+
+
 # ---------------------------------------------------------------------------
 # deep_serialize edge cases
 # ---------------------------------------------------------------------------
@@ -411,6 +1131,15 @@ def test_deep_serialize_set_becomes_list():
     assert set(result) == {1, 2}
 
 
+def test_deep_serialize_builtin_subclasses():
+    from collections import OrderedDict, namedtuple
+
+    Point = namedtuple("Point", ["x", "y"])
+    result = deep_serialize(OrderedDict(p=Point(1, 2), flag=True))
+    assert result == {"p": [1, 2], "flag": True}
+    assert type(result) is dict
+
+
 def test_deep_serialize_nested_dict():
     result = deep_serialize({"a": {"b": {"c": 99}}})
     assert result == {"a": {"b": {"c": 99}}}
@@ -423,6 +1152,23 @@ def test_deep_serialize_depth_limit():
     assert "MaxDepthReached" in result_str
 
 
+def test_deep_serialize_nesting_beyond_recursion_limit():
+    import sys
+
+    depth = sys.getrecursionlimit() * 2
+    nested: list = []
+    node = nested
+    for _ in range(depth):
+        child: list = []
+        node.append(child)
+        node = child
+
+    result = deep_serialize(nested, max_depth=depth + 1)
+    for _ in range(depth):
+        result = result[0]
+    assert result == []
+
+
 def test_deep_serialize_cycle_detection():
     d: dict = {}
     d["self"] = d
@@ -483,6 +1229,26 @@ def test_deep_search_dict_multiple_matches():
     assert "second" in result
 
 
+def test_iter_search_dict_stops_at_first_match():
+    from tool_leash.serialization import iter_search_dict
+
+    entered = []
+
+    class Tracked(list):
+        def __iter__(self):
+            entered.append(self[0]["q"])
+            return super().__iter__()
+
+    data = {"q": "top", "a": Tracked([{"q": 1}]), "b": Tracked([{"q": 2}])}
+    walk = iter_search_dict(data, "q")
+    assert next(walk) == "top"
+    assert next(walk) == 1
+    # Nothing past the last match consumed has been visited yet.
+    assert entered == [1]
+    assert list(walk) == [2]
+    assert deep_search_dict(data, "q") == ["top", 1, 2]
+
+
 # ---------------------------------------------------------------------------
 # estimate_tokens_safely edge cases
 # ---------------------------------------------------------------------------
@@ -525,3 +1291,101 @@ def test_estimate_tokens_dict_with_data():
     data = {"key": "value", "number": 42}
     result = estimate_tokens_safely(data)
     assert result >= 1
+
+
+def test_estimate_tokens_exact_for_numeric_payloads():
+    import json
+
+    payload = {
+        "ints": list(range(-1200, 1200, 7)),
+        "big": [10**12, -(10**15)],
+        "floats": [0.5, -2.25, 1e-07],
+        "flags": [True, False, None],
+    }
+    compact = json.dumps(payload, separators=(",", ":"))
+    assert estimate_tokens_safely(payload) == len(compact) // 4
+
+
+def test_estimate_tokens_homogeneous_sequences_match_item_by_item(monkeypatch):
+    from tool_leash import serialization
+
+    payloads = [
+        ["héllo", "", "x" * 50] * 40,
+        list(range(-3000, 3000, 3)),
+        tuple(i / 7 for i in range(300)),
+        [True, False, None, 1, 2.5] * 30,
+        ["mixed", 1] * 50,
+    ]
+    monkeypatch.setattr(serialization, "_REPR_SLICE", 7)  # exercise slice boundaries
+    fast = [estimate_tokens_safely(p) for p in payloads]
+    monkeypatch.setattr(serialization, "_HOMOGENEOUS_MIN", 10**9)
+    assert fast == [estimate_tokens_safely(p) for p in payloads]
+
+
+def test_estimate_tokens_sampled_close_to_exact():
+    data = [{"id": i, "name": f"user-{i}"} for i in range(50_000)]
+    exact = estimate_tokens_safely(data)
+    sampled = estimate_tokens_safely(data, sample_threshold=SAMPLE_THRESHOLD)
+    assert abs(sampled - exact) / exact < 0.05
+
+
+def test_estimate_tokens_from_raw_matches_serialized_estimate():
+    small = {"a": [1, 2, 3], "b": "text"}
+    assert estimate_tokens_from_raw(small) == estimate_tokens_safely(deep_serialize(small))
+    big = ["a"] * (SAMPLE_THRESHOLD * 10)
+    assert estimate_tokens_from_raw(big) == estimate_tokens_safely(big)
+
+
+def _stride_payload() -> list:
+    # Short strings exactly where a fixed-stride sample would look, bulk everywhere else.
+    n = SAMPLE_THRESHOLD + 1
+    step = n // 64
+    return ["a" if i % step == 0 else "x" * 2000 for i in range(n)]
+
+
+def test_sampling_cannot_be_steered_by_item_positions():
+    data = _stride_payload()
+    exact = estimate_tokens_safely(data)
+    assert estimate_tokens_safely(data, sample_threshold=SAMPLE_THRESHOLD) == exact
+    assert estimate_tokens_from_raw(data) == exact
+    # Mixed sequences are still sampled, but not at positions the caller can pick.
+    mixed = [{"k": item} for item in data]
+    exact = estimate_tokens_safely(mixed)
+    assert estimate_tokens_safely(mixed, sample_threshold=SAMPLE_THRESHOLD) > exact // 2
+    assert estimate_tokens_from_raw(mixed) > exact // 2
+
+
+def test_stride_payload_cannot_slip_past_token_budget():
+    budget = Budget(max_tokens=100_000)
+
+    @leash(budget=budget)
+    def dump() -> list:
+        return _stride_payload()
+
+    @leash(budget=budget)
+    def ingest(items: list) -> None:
+        pass
+
+    with pytest.raises(LeashBudgetExceeded):
+        dump()
+    with pytest.raises(LeashBudgetExceeded):
+        ingest(_stride_payload())
+
+
+def test_estimate_tokens_from_raw_sampled_self_reference():
+    big: list = list(range(SAMPLE_THRESHOLD * 2))
+    big[0] = big
+    assert estimate_tokens_from_raw(big) >= 1
+
+
+def test_exact_token_estimation_opt_out():
+    data = [{"id": i} for i in range(SAMPLE_THRESHOLD + 1)]
+    budget = Budget(max_tokens=10_000_000)
+
+    @leash(budget=budget, fast_token_estimation=False)
+    def dump() -> list:
+        return data
+
+    dump()
+    inputs = estimate_tokens_safely({})
+    assert budget.tokens_used == inputs + estimate_tokens_safely(data)
@@ -0,0 +1,57 @@
+"""Call counters that stay exact with or without the GIL."""
+
+import itertools
+import sys
+import threading
+
+
+def _gil_enabled() -> bool:
+    # Only free-threaded builds (3.13+) can run without the GIL. Once enabled at runtime the
+    # GIL is never switched off again, so the answer seen at import time stays safe.
+    is_gil_enabled = getattr(sys, "_is_gil_enabled", None)
+    return True if is_gil_enabled is None else bool(is_gil_enabled())
+
+
+class _FetchAddCounter:
+    """
+    Counter backed by itertools.count, whose __next__ is a single C-level fetch-and-add
+    and therefore atomic under the GIL.
+    """
+
+    __slots__ = ("_count", "increment")
+
+    def __init__(self, start: int = 0) -> None:
+        self._count = itertools.count(start + 1)
+        # Bound straight to the C method, so an increment runs no Python frame.
+        self.increment = self._count.__next__
+
+    @property
+    def value(self) -> int:
+        # repr() is "count(n)" and, unlike next(), reads the counter without advancing it.
+        return int(repr(self._count)[6:-1]) - 1
+
+
+class _LockedCounter:
+    """Counter for free-threaded builds, where no C-level step is atomic on its own."""
+
+    __slots__ = ("_value", "_lock")
+
+    def __init__(self, start: int = 0) -> None:
+        self._value = start
+        self._lock = threading.Lock()
+
+    def increment(self) -> int:
+        with self._lock:
+            self._value += 1
+            return self._value
+
+    @property
+    def value(self) -> int:
+        return self._value
+
+
+# AtomicCounter(start) counts up from start. increment() adds one and returns the new
+# total; value reads it without changing it.
+AtomicCounter: type[_FetchAddCounter] | type[_LockedCounter] = (
+    _FetchAddCounter if _gil_enabled() else _LockedCounter
+)
@@ -1,47 +1,279 @@
+import math
 import threading
+import weakref
 
+from ._atomic import AtomicCounter
 from .exceptions import LeashBudgetExceeded
 
+# A non-strict Budget publishes each thread's tally to the shared counters once per this
+# many consumptions (or sooner, when publishing could trip a limit).
+_FLUSH_EVERY = 64
+
+
+class _ThreadTally:
+    """One thread's consumption that a non-strict Budget has not published yet."""
+
+    __slots__ = ("calls", "tokens", "ops")
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.tokens = 0
+        self.ops = 0
+
+
+class _TokenHold:
+    """
+    Tokens one stream has metered but not yet consumed from its budget. Only the stream
+    writes `added` and only a holder of the budget lock writes `charged` and `ceiling`,
+    so any thread may charge what is outstanding without losing the stream's concurrent
+    additions. `ceiling` is the stream's lease: while `added` stays within it, the open
+    streams together cannot have crossed the token limit.
+    """
+
+    __slots__ = ("added", "charged", "ceiling")
+
+    def __init__(self) -> None:
+        self.added = 0
+        self.charged = 0
+        # No lease until the budget grants one on the stream's first settle.
+        self.ceiling: float = 0
+
+
+class _ThreadExit:
+    """Held only by a thread's local storage, so it is collected when the thread exits."""
+
+    __slots__ = ("__weakref__",)
+
 
 class Budget:
-    """Manages the stateful execution budget for an agent."""
+    """
+    Manages the stateful execution budget for an agent.
 
-    def __init__(self, max_calls: int | None = None, max_tokens: int | None = None) -> None:
+    With `strict=True` (the default) every consumption is checked against the limits as it
+    happens. `strict=False` is for soft budgets under heavy multi-threaded load: each
+    thread counts into its own tally and publishes it to the shared counters in batches,
+    so threads stop contending on every call. Limits are then enforced when a tally is
+    published, and a budget may be overshot by up to `_FLUSH_EVERY - 1` consumptions per
+    running thread. A thread's tally is published when the thread exits, so short-lived
+    threads count against the limit for every thread that comes after them.
+    `calls_used`, `tokens_used` and `snapshot()` always include unpublished tallies.
+
+    `calls_used` and `tokens_used` can be assigned, and `reset()` zeroes both; neither is
+    meant to race with calls still consuming from the same budget.
+    """
+
+    # Fixed layout: every leashed call reads these, and slots make each read a
+    # direct descriptor load instead of an instance-dict probe.
+    __slots__ = (
+        "max_calls",
+        "max_tokens",
+        "strict",
+        "_tokens",
+        "_calls",
+        "_published_calls",
+        "_lock",
+        "_local",
+        "_tallies",
+        "_holds",
+        "__weakref__",
+    )
+
+    def __init__(
+        self, max_calls: int | None = None, max_tokens: int | None = None, strict: bool = True
+    ) -> None:
         self.max_calls: int | None = max_calls
         self.max_tokens: int | None = max_tokens
-        self.calls_used: int = 0
-        self.tokens_used: int = 0
+        self.strict = strict
+        self._tokens = 0
+        # Lock-free fetch-and-add under the GIL; falls back to a lock on free-threaded builds.
+        self._calls = AtomicCounter()
         self._lock = threading.Lock()
+        # Non-strict mode only: calls published from thread tallies, and the tallies.
+        self._published_calls = 0
+        self._local = threading.local()
+        self._tallies: set[_ThreadTally] = set()
+        # Open stream holds; only read and changed under the lock.
+        self._holds: list[_TokenHold] = []
+
+    @property
+    def calls_used(self) -> int:
+        if self.strict:
+            return self._calls.value
+        with self._lock:
+            return self._published_calls + sum(tally.calls for tally in self._tallies)
+
+    @calls_used.setter
+    def calls_used(self, value: int) -> None:
+        with self._lock:
+            for tally in self._tallies:
+                tally.calls = 0
+            self._published_calls = value
+            self._calls = AtomicCounter(value)
+
+    @property
+    def tokens_used(self) -> int:
+        if self.strict:
+            return self._tokens
+        with self._lock:
+            return self._tokens + sum(tally.tokens for tally in self._tallies)
+
+    @tokens_used.setter
+    def tokens_used(self, value: int) -> None:
+        with self._lock:
+            for tally in self._tallies:
+                tally.tokens = 0
+            self._tokens = value
+
+    def reset(self) -> None:
+        """Zero the calls and tokens used, e.g. to reuse the budget for a new session."""
+        self.calls_used = 0
+        self.tokens_used = 0
+
+    def snapshot(self) -> tuple[int, int]:
+        """Return (calls_used, tokens_used), including tallies not yet published."""
+        return self.calls_used, self.tokens_used
+
+    def _tally(self) -> _ThreadTally:
+        tally: _ThreadTally | None = getattr(self._local, "tally", None)
+        if tally is None:
+            tally = self._local.tally = _ThreadTally()
+            with self._lock:
+                self._tallies.add(tally)
+            # The thread's local storage is released when it exits; collecting this marker
+            # then retires the tally, so threads that never fill a batch still count.
+            exit_marker = self._local.exit_marker = _ThreadExit()
+            weakref.finalize(exit_marker, _retire, weakref.ref(self), tally).atexit = False
+        return tally
+
+    def _retire(self, tally: _ThreadTally) -> None:
+        """Fold an exited thread's tally into the shared counters and stop tracking it."""
+        with self._lock:
+            self._published_calls += tally.calls
+            self._tokens += tally.tokens
+            self._tallies.discard(tally)
+
+    def _publish(self, tally: _ThreadTally) -> None:
+        """Move a thread's tally into the shared counters and enforce the limits."""
+        with self._lock:
+            calls, tokens = tally.calls, tally.tokens
+            self._published_calls += calls
+            self._tokens += tokens
+            tally.calls = tally.tokens = tally.ops = 0
+            published_calls, published_tokens = self._published_calls, self._tokens
+
+        if self.max_calls is not None and published_calls > self.max_calls:
+            raise LeashBudgetExceeded(f"Budget exhausted: max_calls ({self.max_calls}) reached.")
+        if self.max_tokens is not None and published_tokens > self.max_tokens:
+            raise LeashBudgetExceeded(
+                f"Budget exhausted: consuming {tokens} tokens would exceed "
+                f"max_tokens ({self.max_tokens}). Tokens currently used: {published_tokens}."
+            )
 
     def consume_call(self) -> None:
         """Consume a single tool call from the budget."""
         if self.max_calls is not None:
-            with self._lock:
-                self.calls_used += 1
-                if self.calls_used > self.max_calls:
-                    raise LeashBudgetExceeded(
-                        f"Budget exhausted: max_calls ({self.max_calls}) reached."
-                    )
+            if not self.strict:
+                tally = self._tally()
+                tally.calls += 1
+                tally.ops += 1
+                # Publish early once this tally alone would cross the limit, so a single
+                # thread is never allowed past it.
+                if (
+                    tally.ops >= _FLUSH_EVERY
+                    or self._published_calls + tally.calls > self.max_calls
+                ):
+                    self._publish(tally)
+                return
+
+            if self._calls.increment() > self.max_calls:
+                raise LeashBudgetExceeded(
+                    f"Budget exhausted: max_calls ({self.max_calls}) reached."
+                )
 
     def consume_tokens(self, tokens: int) -> None:
         """Consume a specific number of tokens from the budget."""
         if self.max_tokens is not None:
+            if not self.strict:
+                tally = self._tally()
+                tally.tokens += tokens
+                tally.ops += 1
+                if tally.ops >= _FLUSH_EVERY or self._tokens + tally.tokens > self.max_tokens:
+                    self._publish(tally)
+                return
+
+            # Adding an arbitrary delta has no atomic primitive in pure Python, so the add
+            # keeps its lock. Only the add and the read of the new total are held under it;
+            # the limit check and message formatting run after release. Reads below need no
+            # lock: a single int load is always a consistent snapshot.
             with self._lock:
-                self.tokens_used += tokens
-                if self.tokens_used > self.max_tokens:
-                    raise LeashBudgetExceeded(
-                        f"Budget exhausted: consuming {tokens} tokens would exceed "
-                        f"max_tokens ({self.max_tokens}). Tokens currently used: {self.tokens_used}."
-                    )
+                self._tokens += tokens
+                total = self._tokens
+            if total > self.max_tokens:
+                raise LeashBudgetExceeded(
+                    f"Budget exhausted: consuming {tokens} tokens would exceed "
+                    f"max_tokens ({self.max_tokens}). Tokens currently used: {total}."
+                )
+
+    def _open_hold(self) -> _TokenHold:
+        """Start tracking a stream's metered-but-unconsumed tokens."""
+        hold = _TokenHold()
+        with self._lock:
+            # The new stream leases whatever the open ones have not; later settles even
+            # the shares out.
+            if self.max_tokens is None:
+                hold.ceiling = math.inf
+            else:
+                leased = sum(other.ceiling - other.charged for other in self._holds)
+                hold.ceiling = max(0, self.max_tokens - self._tokens - leased)
+            self._holds.append(hold)
+        return hold
+
+    def _settle_holds(self) -> None:
+        """
+        Consume every open stream's outstanding tokens as one charge, then split the
+        tokens still free evenly among the open streams as their new leases.
+        """
+        tokens = 0
+        with self._lock:
+            for hold in self._holds:
+                outstanding = hold.added - hold.charged
+                hold.charged += outstanding
+                tokens += outstanding
+        try:
+            if tokens:
+                self.consume_tokens(tokens)
+        finally:
+            # Even when the charge failed: the streams then get no lease, so each fails
+            # on its next metered item as it would without batching.
+            with self._lock:
+                share: float = math.inf
+                if self.max_tokens is not None and self._holds:
+                    share = max(0, self.max_tokens - self._tokens) // len(self._holds)
+                for hold in self._holds:
+                    hold.ceiling = hold.charged + share
+
+    def _close_hold(self, hold: _TokenHold) -> None:
+        """Charge what is still outstanding and stop tracking the stream."""
+        try:
+            self._settle_holds()
+        finally:
+            with self._lock:
+                self._holds.remove(hold)
 
     def get_remaining_calls(self) -> int | None:
         if self.max_calls is None:
             return None
-        with self._lock:
-            return max(0, self.max_calls - self.calls_used)
+        return max(0, self.max_calls - self.calls_used)
 
     def get_remaining_tokens(self) -> int | None:
         if self.max_tokens is None:
             return None
-        with self._lock:
-            return max(0, self.max_tokens - self.tokens_used)
+        return max(0, self.max_tokens - self.tokens_used)
+
+
+def _retire(budget_ref: "weakref.ref[Budget]", tally: _ThreadTally) -> None:
+    # Exit finalizers hold the budget weakly, so a budget used from a long-lived thread
+    # can still be collected; once it is, there is nothing left to publish into.
+    budget = budget_ref()
+    if budget is not None:
+        budget._retire(tally)
@@ -3,121 +3,365 @@ import inspect
 import json
 import logging
 from collections.abc import AsyncGenerator, Callable, Generator
-from typing import Any, TypeVar, cast
+from types import AsyncGeneratorType, GeneratorType
+from typing import Any, Literal, TypeVar, cast
 
 from .budget import Budget
 from .guard import CallGuard
-from .serialization import deep_serialize, estimate_tokens_safely
+from .serialization import (
+    _SCALAR_TYPES,
+    SAMPLE_THRESHOLD,
+    deep_serialize,
+    estimate_tokens_from_raw,
+    estimate_tokens_safely,
+)
 
 logger = logging.getLogger(__name__)
 
 F = TypeVar("F", bound=Callable[..., Any])
 
 
+# Argument types that get wrapped for per-item checks. Neither can be subclassed, so an
+# exact type() test is equivalent to inspect.isgenerator / isasyncgen.
+_STREAM_TYPES = frozenset({GeneratorType, AsyncGeneratorType})
+
+# Input token counts are memoized per decorated tool for calls whose arguments are all
+# scalars, with strings no longer than this.
+_INPUT_CACHE_SIZE = 1024
+_CACHEABLE_STR_LEN = 1024
+
+# Streams charge their per-item tokens to the budget once per this many items.
+_TOKEN_BATCH_SIZE = 64
+
+
+def _identity(obj: Any) -> Any:
+    return obj
+
+
+def _serialize_for_metering(obj: Any) -> Any:
+    """Token metering only needs sizes, so scalars skip the deep_serialize walk."""
+    if type(obj) in _SCALAR_TYPES:
+        return obj
+    return deep_serialize(obj)
+
+
+def _serialize_arguments(arguments: dict[str, Any]) -> Any:
+    """Bound arguments that are all scalars are already their own serialized form."""
+    if _SCALAR_TYPES.issuperset(map(type, arguments.values())):
+        return arguments
+    return deep_serialize(arguments)
+
+
+def _scalar_key(serialized: Any) -> tuple[tuple[str, type, Any], ...] | None:
+    """
+    Cache key for serialized arguments made only of scalars and short strings, else
+    None. Each value's type is part of the key, so True and 1 never share an entry.
+    Float zeros are not cached: 0.0 == -0.0 with equal hashes, but they render
+    differently, and every other pair of equal floats renders the same.
+    """
+    if type(serialized) is not dict:
+        return None
+    key = []
+    for name, value in serialized.items():
+        kind = type(value)
+        if kind not in _SCALAR_TYPES or (kind is str and len(value) > _CACHEABLE_STR_LEN):
+            return None
+        if kind is float and not value:
+            return None
+        key.append((name, kind, value))
+    return tuple(key)
+
+
+def _item_for_metering(arg_name: str, item: Any) -> Any:
+    """Without a guard, stream items are metered raw and need no serialization here."""
+    return item
+
+
+class _TokenBatch:
+    """
+    One stream's per-item token charges, consumed from the budget every _TOKEN_BATCH_SIZE
+    items instead of taking the budget lock for each. Each stream holds a lease on an
+    even share of the tokens still free; an item that overruns it settles every open
+    stream's outstanding tokens together, so a stream still fails on the same item it
+    would without batching. The error then reports that combined charge rather than the
+    last item's cost.
+    """
+
+    __slots__ = ("_budget", "_hold", "_items")
+
+    def __init__(self, budget: Budget) -> None:
+        self._budget = budget
+        self._hold = budget._open_hold()
+        self._items = 0
+
+    def add(self, tokens: int) -> None:
+        hold = self._hold
+        hold.added += tokens
+        self._items += 1
+        if hold.added > hold.ceiling or self._items >= _TOKEN_BATCH_SIZE:
+            self._items = 0
+            self._budget._settle_holds()
+
+    def close(self) -> None:
+        self._budget._close_hold(self._hold)
+
+
+class _UnmeteredBatch(_TokenBatch):
+    """Stand-in batch for streams that no token budget meters."""
+
+    def __init__(self) -> None:
+        pass
+
+    def add(self, tokens: int) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+def _no_tokens(obj: Any) -> int:
+    return 0
+
+
+def _unmetered_batch() -> _TokenBatch:
+    return _UnmeteredBatch()
+
+
 def leash(
     budget: Budget | None = None,
     hitl: CallGuard | None = None,
-    tokenizer_func: Callable[[str], int] | None = None,
+    tokenizer_func: Callable[[Any], int] | None = None,
+    tokenizer_expects: Literal["string", "structured"] = "string",
+    fast_token_estimation: bool = True,
 ) -> Callable[[F], F]:
     """
     A decorator that enforces execution budgets and HITL policies on a tool function.
+
+    `tokenizer_func` receives the payload rendered as a JSON string by default. Pass
+    `tokenizer_expects="structured"` to hand it the serialized dict/list directly and
+    skip building that string.
+
+    Input counts for all-scalar arguments are memoized per tool, so `tokenizer_func`
+    must be pure: the same payload always yields the same count.
+
+    With `fast_token_estimation` (the default) the built-in estimator measures mixed lists
+    and tuples longer than SAMPLE_THRESHOLD from a random sample rather than item by item;
+    pass False for exact accounting.
     """
+    if tokenizer_expects not in ("string", "structured"):
+        raise ValueError(
+            f"tokenizer_expects must be 'string' or 'structured', got {tokenizer_expects!r}"
+        )
 
     def decorator(func: F) -> F:
+        # Everything that only depends on the decoration is resolved once here: the
+        # enabled checks are composed into step tuples, so the per-call path never
+        # re-tests hitl / budget / tokenizer_func.
+        sig = inspect.signature(func)
+        tool_name = func.__name__
+
+        sample_threshold = SAMPLE_THRESHOLD if fast_token_estimation else None
+
+        def _estimate(serialized: Any) -> int:
+            return estimate_tokens_safely(serialized, sample_threshold)
+
+        count_tokens: Callable[[Any], int] = _estimate
+        if tokenizer_func is not None:
+            tokenize = tokenizer_func
+            render: Callable[[Any], Any] = (
+                json.dumps if tokenizer_expects == "string" else _identity
+            )
+
+            def _count_with_tokenizer(serialized: Any) -> int:
+                try:
+                    return tokenize(render(serialized))
+                except Exception:
+                    return _estimate(serialized)
+
+            count_tokens = _count_with_tokenizer
+
+        # Tokens for a raw result or stream item that no guard needs in serialized form.
+        if tokenizer_func is None and sample_threshold is not None:
+            threshold = sample_threshold
+
+            def measure_raw(obj: Any) -> int:
+                if type(obj) in _SCALAR_TYPES:
+                    return estimate_tokens_safely(obj)
+                # Long sequences are sampled before serialization, not after.
+                return estimate_tokens_from_raw(obj, threshold)
+
+        else:
+
+            def measure_raw(obj: Any) -> int:
+                return count_tokens(_serialize_for_metering(obj))
+
+        # Serializes the bound arguments of every call. With a guard, the policy is
+        # evaluated during that same walk.
+        serialize_inputs: Callable[[dict[str, Any]], Any] = _serialize_arguments
+        # Run against the serialized bound arguments of every call, in order.
+        input_steps: list[Callable[[Any], None]] = []
+        # Serializes (and guards) each item pulled from a generator argument.
+        serialize_item: Callable[[str, Any], Any] = _item_for_metering
+        # Tokens for each serialized item pulled from a generator argument.
+        measure_item: Callable[[Any], int] = _no_tokens
+        # Tokens for each item the tool itself yields.
+        measure_yield: Callable[[Any], int] = _no_tokens
+        # Collects one stream's item tokens for the budget.
+        open_batch: Callable[[], _TokenBatch] = _unmetered_batch
+        # Run against every raw, non-streamed result of the tool.
+        output_steps: list[Callable[[Any], None]] = []
+
+        if hitl is not None:
+            serialize_and_evaluate = hitl.serialize_and_evaluate
+
+            def _serialize_guarded(arguments: dict[str, Any]) -> Any:
+                return serialize_and_evaluate(tool_name, arguments)
+
+            def _serialize_guarded_item(arg_name: str, item: Any) -> Any:
+                # One walk both serializes and guards the item; the meter then reuses
+                # that serialized form. The extra level of depth keeps the item itself
+                # serialized exactly as deep_serialize(item) would.
+                return serialize_and_evaluate(tool_name, {arg_name: item}, max_depth=11)[arg_name]
+
+            serialize_inputs = _serialize_guarded
+            serialize_item = _serialize_guarded_item
+
+        if budget is not None and budget.max_tokens is not None:
+            consume_tokens = budget.consume_tokens
+
+            @functools.lru_cache(maxsize=_INPUT_CACHE_SIZE)
+            def _count_scalar_inputs(key: tuple[tuple[str, type, Any], ...]) -> int:
+                return count_tokens({name: value for name, _, value in key})
+
+            def _meter_inputs(serialized: Any) -> None:
+                # Tools are often called again with the same few scalar arguments; those
+                # reuse the count instead of re-measuring (and re-tokenizing) the payload.
+                key = _scalar_key(serialized)
+                consume_tokens(
+                    count_tokens(serialized) if key is None else _count_scalar_inputs(key)
+                )
+
+            # Items arrive serialized only when the guard needed them that way.
+            measure_item = count_tokens if hitl is not None else measure_raw
+            measure_yield = measure_raw
+            metered_budget = budget
+
+            def _open_token_batch() -> _TokenBatch:
+                return _TokenBatch(metered_budget)
+
+            def _meter_output(result: Any) -> None:
+                consume_tokens(measure_raw(result))
+
+            open_batch = _open_token_batch
+            input_steps.append(_meter_inputs)
+            output_steps.append(_meter_output)
+
+        if budget is not None:
+            consume_call = budget.consume_call
+
+            def _count_call(serialized: Any) -> None:
+                consume_call()
+
+            input_steps.append(_count_call)
+
+        needs_serialize = hitl is not None or (
+            budget is not None and budget.max_tokens is not None
+        )
+        pre_steps = tuple(input_steps)
+        post_steps = tuple(output_steps)
+
         def _wrap_input_generator(
             gen: Generator[Any, Any, Any], arg_name: str = ""
         ) -> Generator[Any, Any, Any]:
-            for item in gen:
-                serialized_item = deep_serialize(item)
-                if hitl:
-                    hitl.evaluate_serialized(func.__name__, {arg_name: serialized_item})
-                if budget and budget.max_tokens is not None:
-                    if tokenizer_func:
-                        try:
-                            consumed = tokenizer_func(json.dumps(serialized_item))
-                        except Exception:
-                            consumed = estimate_tokens_safely(serialized_item)
-                    else:
-                        consumed = estimate_tokens_safely(serialized_item)
-                    budget.consume_tokens(consumed)
-                yield item
+            batch = open_batch()
+            try:
+                for item in gen:
+                    batch.add(measure_item(serialize_item(arg_name, item)))
+                    yield item
+            finally:
+                # Charge whatever the last partial batch holds, even if the stream was
+                # abandoned or raised.
+                batch.close()
 
         def _wrap_input_async_generator(
             gen: AsyncGenerator[Any, Any], arg_name: str = ""
         ) -> AsyncGenerator[Any, Any]:
             async def wrapper() -> AsyncGenerator[Any, Any]:
-                async for item in gen:
-                    serialized_item = deep_serialize(item)
-                    if hitl:
-                        hitl.evaluate_serialized(func.__name__, {arg_name: serialized_item})
-                    if budget and budget.max_tokens is not None:
-                        if tokenizer_func:
-                            try:
-                                consumed = tokenizer_func(json.dumps(serialized_item))
-                            except Exception:
-                                consumed = estimate_tokens_safely(serialized_item)
-                        else:
-                            consumed = estimate_tokens_safely(serialized_item)
-                        budget.consume_tokens(consumed)
-                    yield item
+                batch = open_batch()
+                try:
+                    async for item in gen:
+                        batch.add(measure_item(serialize_item(arg_name, item)))
+                        yield item
+                finally:
+                    batch.close()
 
             return wrapper()
 
-        def _process_inputs(
-            args: tuple[Any, ...], kwargs: dict[str, Any]
-        ) -> tuple[tuple[Any, ...], dict[str, Any]]:
-            new_args = list(args)
-            for i, arg in enumerate(new_args):
-                if inspect.isgenerator(arg):
-                    new_args[i] = _wrap_input_generator(arg, arg_name=f"arg_{i}")
-                elif inspect.isasyncgen(arg):
-                    new_args[i] = _wrap_input_async_generator(arg, arg_name=f"arg_{i}")
-
-            new_kwargs = dict(kwargs)
-            for k, v in new_kwargs.items():
-                if inspect.isgenerator(v):
-                    new_kwargs[k] = _wrap_input_generator(v, arg_name=k)
-                elif inspect.isasyncgen(v):
-                    new_kwargs[k] = _wrap_input_async_generator(v, arg_name=k)
-
-            return tuple(new_args), new_kwargs
-
-        def _pre_execution(args: tuple[Any, ...], kwargs: dict[str, Any]) -> None:
-            # Serialize ONCE at the boundary for both HITL and Budgeting
-            sig = inspect.signature(func)
-            bound_args = sig.bind(*args, **kwargs)
-            bound_args.apply_defaults()
-            serialized_inputs = deep_serialize(bound_args.arguments)
-
-            if hitl:
-                # HITL Policy now accepts the pre-serialized dictionary
-                hitl.evaluate_serialized(func.__name__, serialized_inputs)
-
-            if budget and budget.max_tokens is not None:
-                if tokenizer_func:
-                    try:
-                        consumed = tokenizer_func(json.dumps(serialized_inputs))
-                    except Exception:
-                        consumed = estimate_tokens_safely(serialized_inputs)
-                else:
-                    consumed = estimate_tokens_safely(serialized_inputs)
-                budget.consume_tokens(consumed)
-
-            if budget:
-                budget.consume_call()
+        if needs_serialize:
+
+            def _process_inputs(
+                args: tuple[Any, ...], kwargs: dict[str, Any]
+            ) -> tuple[tuple[Any, ...], dict[str, Any]]:
+                # Almost no call streams its inputs: a C-level scan decides that without
+                # copying args/kwargs or calling back into Python per argument.
+                if _STREAM_TYPES.isdisjoint(map(type, args)) and _STREAM_TYPES.isdisjoint(
+                    map(type, kwargs.values())
+                ):
+                    return args, kwargs
+
+                new_args = list(args)
+                for i, arg in enumerate(new_args):
+                    if type(arg) is GeneratorType:
+                        new_args[i] = _wrap_input_generator(arg, arg_name=f"arg_{i}")
+                    elif type(arg) is AsyncGeneratorType:
+                        new_args[i] = _wrap_input_async_generator(arg, arg_name=f"arg_{i}")
+
+                new_kwargs = dict(kwargs)
+                for k, v in new_kwargs.items():
+                    if type(v) is GeneratorType:
+                        new_kwargs[k] = _wrap_input_generator(v, arg_name=k)
+                    elif type(v) is AsyncGeneratorType:
+                        new_kwargs[k] = _wrap_input_async_generator(v, arg_name=k)
+
+                return tuple(new_args), new_kwargs
+
+        else:
+
+            def _process_inputs(
+                args: tuple[Any, ...], kwargs: dict[str, Any]
+            ) -> tuple[tuple[Any, ...], dict[str, Any]]:
+                # Nothing inspects streamed items, so generators are passed through untouched.
+                return args, kwargs
+
+        if needs_serialize:
+
+            def _pre_execution(args: tuple[Any, ...], kwargs: dict[str, Any]) -> None:
+                # Serialize ONCE at the boundary for both HITL and Budgeting
+                bound_args = sig.bind(*args, **kwargs)
+                bound_args.apply_defaults()
+                serialized_inputs = serialize_inputs(bound_args.arguments)
+                for step in pre_steps:
+                    step(serialized_inputs)
+
+        elif pre_steps:
+
+            def _pre_execution(args: tuple[Any, ...], kwargs: dict[str, Any]) -> None:
+                # Only the call counter runs, and it never reads the payload, so the
+                # O(input size) serialization is skipped. Binding still rejects a
+                # malformed call before it is charged.
+                sig.bind(*args, **kwargs)
+                for step in pre_steps:
+                    step(None)
+
+        else:
+
+            def _pre_execution(args: tuple[Any, ...], kwargs: dict[str, Any]) -> None:
+                return None
 
         def _consume_post_execution(result: Any) -> None:
             """Helper to consume tokens from standard results."""
-            if budget and budget.max_tokens is not None:
-                serialized = deep_serialize(result)
-                if tokenizer_func:
-                    try:
-                        consumed = tokenizer_func(json.dumps(serialized))
-                    except Exception:
-                        consumed = estimate_tokens_safely(serialized)
-                else:
-                    consumed = estimate_tokens_safely(serialized)
-                budget.consume_tokens(consumed)
+            for step in post_steps:
+                step(result)
 
         if inspect.isasyncgenfunction(func):
 
@@ -125,12 +369,14 @@ def leash(
             async def async_gen_wrapper(*args: Any, **kwargs: Any) -> AsyncGenerator[Any, Any]:
                 processed_args, processed_kwargs = _process_inputs(args, kwargs)
                 _pre_execution(processed_args, processed_kwargs)
+                batch = open_batch()
                 try:
                     async for item in func(*processed_args, **processed_kwargs):
-                        _consume_post_execution(item)
+                        batch.add(measure_yield(item))
                         yield item
                 finally:
-                    pass
+                    # Tokens for items already yielded are charged even if the stream crashed.
+                    batch.close()
 
             return cast(F, async_gen_wrapper)
 
@@ -154,15 +400,20 @@ def leash(
                 _pre_execution(processed_args, processed_kwargs)
                 result = func(*processed_args, **processed_kwargs)
 
-                if inspect.isgenerator(result):
+                # Same exact-type test as for arguments: cheaper than inspect.isgenerator.
+                if type(result) is GeneratorType:
+                    if not post_steps:
+                        # Nothing meters the stream, so there is no reason to re-wrap it.
+                        return result
 
                     def gen_wrapper() -> Generator[Any, Any, Any]:
+                        batch = open_batch()
                         try:
                             for item in result:
-                                _consume_post_execution(item)
+                                batch.add(measure_yield(item))
                                 yield item
                         finally:
-                            pass
+                            batch.close()
 
                     return gen_wrapper()
 
@@ -1,21 +1,378 @@
+import itertools
 import json
-from collections.abc import Callable
+import sys
+import threading
+from collections import OrderedDict
+from collections.abc import Callable, Iterator, Mapping, Sequence
+from types import MappingProxyType
 from typing import Any
 
 from .exceptions import CallBlockedError
-from .serialization import deep_search_dict
+from .serialization import _SCALAR_TYPES, _search_keys, deep_serialize
+
+
+class _SubstringMatcher:
+    """
+    The restricted substrings of one argument, compiled once at CallGuard construction.
+
+    Matching is a loop of C-level `str.__contains__` scans over a tuple. Measured against
+    a compiled re alternation (the stdlib's closest thing to a multi-pattern automaton),
+    the loop is faster on every value longer than a few dozen characters; a pure-Python
+    Aho-Corasick automaton pays interpreter cost per character and is slower still.
+
+    Instead the pattern set is reduced once, the way an automaton's dictionary links
+    would: a substring that contains an earlier one can never be the first match (any
+    text holding it also holds the earlier substring), so it is dropped from the scan.
+    Text shorter than every substring is rejected by length before any scan runs.
+
+    An earlier substring may still contain a later one (["DROP TABLE", "DROP"]); the
+    longer one can then only match where the shorter one does. For such sets `cores`
+    holds just the substrings that contain no other: text free of every core is clean,
+    which spares benign values (the common case) the longer scans. The full ordered scan
+    only runs once a core has matched, so the reported substring is the same.
+
+    When several of the scanned substrings share a first character (["DELETE", "DROP"]),
+    `initials` holds the distinct ones: every match starts with one of them, so text
+    containing none is clean after one scan per initial rather than per substring.
+
+    With `case_insensitive`, the substrings are casefolded here once and each scanned
+    text once per find(); a match still reports the substring as configured.
+    """
+
+    __slots__ = ("substrings", "min_len", "cores", "initials", "case_insensitive", "_configured")
+
+    def __init__(self, substrings: Sequence[str], case_insensitive: bool = False) -> None:
+        self.case_insensitive = case_insensitive
+        # Folded form -> configured spelling, for reporting a case-insensitive match.
+        self._configured: dict[str, str] | None = {} if case_insensitive else None
+        kept: list[str] = []
+        for configured in substrings:
+            substring = configured.casefold() if case_insensitive else configured
+            if not any(earlier in substring for earlier in kept):
+                kept.append(substring)
+                if self._configured is not None:
+                    self._configured[substring] = configured
+        self.substrings = tuple(kept)
+        self.min_len = min(map(len, kept), default=0)
+        cores = tuple(
+            substring
+            for substring in kept
+            if not any(other in substring for other in kept if other is not substring)
+        )
+        self.cores = cores if len(cores) < len(kept) else None
+        scanned = cores or kept
+        initials = tuple(dict.fromkeys(substring[0] for substring in scanned if substring))
+        self.initials = initials if self.min_len > 0 and len(initials) < len(scanned) else None
+
+    def find(self, text: str) -> str | None:
+        """Return the first configured substring contained in `text`."""
+        if self.case_insensitive:
+            text = text.casefold()
+        if len(text) < self.min_len:
+            return None
+        if self.initials is not None:
+            for initial in self.initials:
+                if initial in text:
+                    break
+            else:
+                return None
+        if self.cores is not None:
+            for core in self.cores:
+                if core in text:
+                    break
+            else:
+                return None
+        for substring in self.substrings:
+            if substring in text:
+                return substring if self._configured is None else self._configured[substring]
+        return None
+
+
+# Values rendered as JSON before scanning. A module-level tuple: `dict | list` written
+# inline would build a new union object on every isinstance() call.
+_JSON_CONTAINERS = (dict, list)
+
+# Containers with more top-level entries than this are checked slice by slice instead of
+# as one json.dumps() string.
+_JSON_SLICE = 1024
+
+
+def _json_slices(value: dict[Any, Any] | list[Any]) -> Iterator[str]:
+    """
+    json.dumps(value) in consecutive pieces. Only the top level is split: each piece is
+    one C-encoded run of up to _JSON_SLICE entries, so the output is byte-for-byte the
+    same as the full dump.
+    """
+    if isinstance(value, dict):
+        yield "{"
+        items = iter(value.items())
+        separator = ""
+        while batch := dict(itertools.islice(items, _JSON_SLICE)):
+            yield separator + json.dumps(batch)[1:-1]
+            separator = ", "
+        yield "}"
+    else:
+        yield "["
+        separator = ""
+        for start in range(0, len(value), _JSON_SLICE):
+            yield separator + json.dumps(value[start : start + _JSON_SLICE])[1:-1]
+            separator = ", "
+        yield "]"
+
+
+def _json_may_contain(value: dict[Any, Any] | list[Any], matcher: _SubstringMatcher) -> bool:
+    """
+    Whether json.dumps(value) contains a restricted substring, without building it.
+    Consecutive pieces are scanned with an overlap one character shorter than the
+    longest substring, so a match straddling two pieces is still seen.
+    """
+    overlap = max(map(len, matcher.substrings), default=0) - 1
+    tail = ""
+    for piece in _json_slices(value):
+        window = tail + piece
+        if matcher.find(window) is not None:
+            return True
+        tail = window[-overlap:] if overlap > 0 else ""
+    return False
+
+
+def _find_restricted(
+    value: Any, matcher: _SubstringMatcher, rendered: dict[int, str] | None = None
+) -> tuple[str, str] | None:
+    """
+    Return (substring, searched text) for the first restricted substring in `value`.
+
+    `rendered` memoizes container JSON by id() for the length of one evaluation, where
+    the payload keeps every value alive, so a subtree reached through several restricted
+    keys is dumped once.
+    """
+    if type(value) is str:
+        # The common case: str() of a str is itself, so skip the call.
+        val_str = value
+    elif isinstance(value, _JSON_CONTAINERS):
+        # A large container never needs its whole JSON string unless it is blocked;
+        # the full string is only built to report a hit.
+        if len(value) > _JSON_SLICE and not _json_may_contain(value, matcher):
+            return None
+        # Convert the specific discovered value to a JSON string for flat searching
+        if rendered is None:
+            val_str = json.dumps(value)
+        else:
+            # json.dumps() never returns "", so an empty default means not yet rendered.
+            val_str = rendered.get(id(value), "")
+            if not val_str:
+                val_str = rendered[id(value)] = json.dumps(value)
+    else:
+        val_str = str(value)
+    substring = matcher.find(val_str)
+    if substring is None:
+        return None
+    return substring, val_str
+
+
+def _blocked(func_name: str, arg_name: str, substring: str, val_str: str) -> CallBlockedError:
+    return CallBlockedError(
+        message=f"Call blocked: Tool '{func_name}' argument '{arg_name}' contains restricted substring '{substring}'.",
+        tool_name=func_name,
+        trigger_reason=f"Matched restricted substring '{substring}' in resolved argument '{arg_name}': {val_str}",
+    )
+
+
+def _intern(key: str) -> str:
+    # sys.intern() only accepts exact str; subclasses are kept as given.
+    return sys.intern(key) if type(key) is str else key
+
+
+class _ArgumentScan:
+    """deep_serialize visitor that records the first restricted argument it sees."""
+
+    __slots__ = ("_matchers", "violation")
+
+    def __init__(self, matchers: dict[str, _SubstringMatcher]) -> None:
+        self._matchers = matchers
+        self.violation: tuple[str, str, str] | None = None
+
+    def visit(self, key: str, value: Any) -> None:
+        # Most entries are not restricted: settle those with a single dict probe.
+        matcher = self._matchers.get(key)
+        if matcher is not None and self.violation is None:
+            hit = _find_restricted(value, matcher)
+            if hit is not None:
+                self.violation = (key, *hit)
+
+
+def _compile_flat_check(
+    matchers: dict[str, _SubstringMatcher],
+) -> Callable[[str, dict[Any, Any]], None]:
+    """
+    Build the key-targeted check for payloads whose values are all scalars, specialized
+    to one guard's fixed policy. Nothing is nested, so each restricted key can only be a
+    top-level entry: one dict lookup per key replaces the walk, in restricted_args order.
+
+    A scalar is searched as itself when it is a str and as str(value) otherwise, which is
+    all _find_restricted() would do with it, so each key's find() is called directly.
+    The (key, find) pairs are a flat tuple held in the closure, and the common policy of
+    a single restricted key gets a loop-free check.
+    """
+    checks = tuple((key, matcher.find) for key, matcher in matchers.items())
+
+    if len(checks) == 1:
+        ((only_key, only_find),) = checks
+
+        def check_one(func_name: str, payload: dict[Any, Any]) -> None:
+            if only_key in payload:
+                value = payload[only_key]
+                text = value if type(value) is str else str(value)
+                substring = only_find(text)
+                if substring is not None:
+                    raise _blocked(func_name, only_key, substring, text)
+
+        return check_one
+
+    def check_each(func_name: str, payload: dict[Any, Any]) -> None:
+        for key, find in checks:
+            if key in payload:
+                value = payload[key]
+                text = value if type(value) is str else str(value)
+                substring = find(text)
+                if substring is not None:
+                    raise _blocked(func_name, key, substring, text)
+
+    return check_each
+
+
+# Marks a payload that has no cached verdict.
+_UNCACHED: Any = object()
+
+# Payloads whose repr() is longer than this are evaluated without the verdict cache, so
+# a single cache entry never holds more than this many characters of key.
+_VERDICT_KEY_MAX = 4096
+_SIZED_TYPES = (str, dict, list, tuple)
+
+
+def _surely_oversized(payload: Any) -> bool:
+    """
+    Whether a payload's repr() must exceed _VERDICT_KEY_MAX, judged from its top-level
+    values' len() alone. A large payload is then turned away without being rendered,
+    while one that passes costs far less than its repr().
+    """
+    if type(payload) is not dict:
+        return False
+    if len(payload) > _VERDICT_KEY_MAX // 3:
+        return True
+    floor = 0
+    for value in payload.values():
+        if isinstance(value, _SIZED_TYPES):
+            # A string renders at least its characters, and a container at least three
+            # per entry: the entry, a separator and a space (or its brackets).
+            floor += len(value) if type(value) is str else 3 * len(value)
+    return floor > _VERDICT_KEY_MAX
 
 
 class CallGuard:
-    """Evaluates whether a tool call should be blocked based on argument patterns."""
+    """
+    Evaluates whether a tool call should be blocked based on argument patterns.
+
+    `restricted_args` is compiled into matchers, so the policy is read back as a read-only
+    mapping of tuples: editing it in place raises instead of being silently ignored.
+    Assigning `restricted_args` (or `case_insensitive`) recompiles the policy. With
+    `case_insensitive=True`, substrings match regardless of case (compared after
+    str.casefold()).
+
+    `verdict_cache_size` keeps the restricted-argument verdicts of that many distinct
+    nested payloads in an LRU, keyed by their serialized repr(), so an identical retried
+    call skips the search. Both evaluate_serialized() and serialize_and_evaluate() (and so
+    @leash) use it. Payloads whose repr() exceeds _VERDICT_KEY_MAX characters are not
+    cached. The key is only faithful for JSON-like payloads, which evaluate_serialized
+    expects anyway. It is off by default: building the key costs about as much as a walk
+    over a small policy, so it only pays off for large policies and repetitive callers.
+    The custom validator is never cached and still runs on every call. Assigning
+    `verdict_cache_size` resizes the LRU, keeping its most recent verdicts; 0 drops it.
+    """
+
+    # No instance dict, so nothing can shadow the compiled _check_flat closure per instance.
+    __slots__ = (
+        "_restricted_args",
+        "custom_validator",
+        "_case_insensitive",
+        "_verdict_cache_size",
+        "_matchers",
+        "_check_flat",
+        "_verdicts",
+        "_verdicts_lock",
+    )
 
     def __init__(
         self,
         restricted_args: dict[str, list[str]] | None = None,
         custom_validator: Callable[[dict[str, Any]], None] | None = None,
+        case_insensitive: bool = False,
+        verdict_cache_size: int = 0,
     ):
-        self.restricted_args = restricted_args or {}
         self.custom_validator = custom_validator
+        # repr(payload) -> the recorded violation, None for a clean payload.
+        self._verdicts: OrderedDict[str, tuple[str, str, str] | None] | None = None
+        self._verdicts_lock = threading.Lock()
+        self.verdict_cache_size = verdict_cache_size
+        self._case_insensitive = case_insensitive
+        self.restricted_args = restricted_args or {}
+
+    @property
+    def restricted_args(self) -> Mapping[str, Sequence[str]]:
+        return self._restricted_args
+
+    @restricted_args.setter
+    def restricted_args(self, restricted_args: Mapping[str, Sequence[str]]) -> None:
+        # A frozen copy: the caller's dict and lists are not shared with the policy.
+        self._restricted_args: Mapping[str, Sequence[str]] = MappingProxyType(
+            {key: tuple(substrings) for key, substrings in restricted_args.items()}
+        )
+        self._compile()
+
+    @property
+    def case_insensitive(self) -> bool:
+        return self._case_insensitive
+
+    @case_insensitive.setter
+    def case_insensitive(self, case_insensitive: bool) -> None:
+        self._case_insensitive = case_insensitive
+        self._compile()
+
+    @property
+    def verdict_cache_size(self) -> int:
+        return self._verdict_cache_size
+
+    @verdict_cache_size.setter
+    def verdict_cache_size(self, verdict_cache_size: int) -> None:
+        self._verdict_cache_size = verdict_cache_size
+        if verdict_cache_size <= 0:
+            self._verdicts = None
+            return
+        # A fresh LRU holding the most recent verdicts that still fit, swapped in as in
+        # _compile() so a store racing with the resize cannot overfill it.
+        verdicts: OrderedDict[str, tuple[str, str, str] | None] = OrderedDict()
+        old = self._verdicts
+        if old is not None:
+            with self._verdicts_lock:
+                verdicts.update(list(old.items())[-verdict_cache_size:])
+        self._verdicts = verdicts
+
+    def _compile(self) -> None:
+        """Rebuild everything derived from the policy, dropping verdicts of the old one."""
+        # Keys are interned: payload keys that are parameter names or source literals are
+        # interned too, so a hit in the walk's `key in matchers` probe settles on identity
+        # instead of comparing characters. Keys loaded from config would otherwise not be.
+        self._matchers = {
+            _intern(target_arg_name): _SubstringMatcher(
+                forbidden_substrings, self._case_insensitive
+            )
+            for target_arg_name, forbidden_substrings in self._restricted_args.items()
+        }
+        self._check_flat = _compile_flat_check(self._matchers)
+        # A fresh LRU rather than clear(), assigned after the matchers: a verdict still
+        # being computed under the old policy is then stored in the discarded one.
+        if self._verdicts is not None:
+            self._verdicts = OrderedDict()
 
     def evaluate_serialized(self, func_name: str, serialized_args: dict[str, Any]) -> None:
         """
@@ -27,22 +384,117 @@ class CallGuard:
             self.custom_validator(serialized_args)
 
         # 2. Key-Targeted Recursive Validation
-        for target_arg_name, forbidden_substrings in self.restricted_args.items():
-            # Recursively hunt for the targeted key anywhere in the payload (catches **kwargs nesting)
-            found_values = deep_search_dict(serialized_args, target_arg_name)
-
-            for matched_value in found_values:
-                # Convert the specific discovered value to a JSON string for flat searching
-                val_str = (
-                    json.dumps(matched_value)
-                    if isinstance(matched_value, dict | list)
-                    else str(matched_value)
-                )
-
-                for substring in forbidden_substrings:
-                    if substring in val_str:
-                        raise CallBlockedError(
-                            message=f"Call blocked: Tool '{func_name}' argument '{target_arg_name}' contains restricted substring '{substring}'.",
-                            tool_name=func_name,
-                            trigger_reason=f"Matched restricted substring '{substring}' in resolved argument '{target_arg_name}': {val_str}",
-                        )
+        matchers = self._matchers
+        if not matchers:
+            return
+        if type(serialized_args) is dict and _SCALAR_TYPES.issuperset(
+            map(type, serialized_args.values())
+        ):
+            self._check_flat(func_name, serialized_args)
+            return
+
+        violation = self._cached_violation(serialized_args)
+        if violation is not None:
+            raise _blocked(func_name, *violation)
+
+    def _cached_violation(self, serialized_args: Any) -> tuple[str, str, str] | None:
+        """_find_violation(), answered from the verdict LRU when it is enabled."""
+        # Bound in the reverse order of _compile(), so a recompile in between pairs the
+        # old LRU with the new matchers at worst, never the new LRU with the old ones.
+        verdicts = self._verdicts
+        matchers = self._matchers
+        if verdicts is None:
+            return self._find_violation(serialized_args, matchers)
+        # The verdict does not depend on func_name, which only appears in the message.
+        key = None if _surely_oversized(serialized_args) else repr(serialized_args)
+        if key is None or len(key) > _VERDICT_KEY_MAX:
+            return self._find_violation(serialized_args, matchers)
+        with self._verdicts_lock:
+            violation = verdicts.get(key, _UNCACHED)
+            if violation is not _UNCACHED:
+                verdicts.move_to_end(key)
+                return violation  # type: ignore[no-any-return]
+        violation = self._find_violation(serialized_args, matchers)
+        with self._verdicts_lock:
+            verdicts[key] = violation
+            if len(verdicts) > self._verdict_cache_size:
+                verdicts.popitem(last=False)
+        return violation
+
+    def _find_violation(
+        self, serialized_args: Any, matchers: dict[str, _SubstringMatcher]
+    ) -> tuple[str, str, str] | None:
+        """Walk a nested payload for the (key, substring, text) evaluate_serialized reports."""
+        # Hunt for every targeted key anywhere in the payload (catches **kwargs nesting) in
+        # a single walk. The reported hit is the first one for the earliest key in
+        # restricted_args, as if each key were searched in turn, so only a hit on that
+        # leading key can end the walk early.
+        lead_arg_name = next(iter(matchers))
+        hits: dict[str, tuple[str, str]] = {}
+        rendered: dict[int, str] = {}
+        for arg_name, matched_value in _search_keys(serialized_args, matchers):
+            if arg_name in hits:
+                continue
+            hit = _find_restricted(matched_value, matchers[arg_name], rendered)
+            if hit is not None:
+                hits[arg_name] = hit
+                if arg_name == lead_arg_name:
+                    break
+
+        for target_arg_name in matchers:
+            if target_arg_name in hits:
+                return (target_arg_name, *hits[target_arg_name])
+        return None
+
+    def serialize_and_evaluate(
+        self, func_name: str, args: dict[str, Any], max_depth: int = 10
+    ) -> Any:
+        """
+        Serialize raw `args` and evaluate them in the same walk, returning the serialized
+        payload. Equivalent to deep_serialize() followed by evaluate_serialized(), but
+        restricted keys are checked as deep_serialize emits them, so a clean payload is
+        never traversed a second time. Only a blocked one is walked again, to report the
+        same violation evaluate_serialized() would.
+        Raises CallBlockedError if a rule is triggered.
+        """
+        if (
+            max_depth > 1
+            and type(args) is dict
+            and _SCALAR_TYPES.issuperset(map(type, args.values()))
+        ):
+            # Scalar arguments serialize to themselves: that is the whole deep_serialize
+            # result, and no visitor is needed to find the restricted keys.
+            flat = {str(key): value for key, value in args.items()}
+            if self.custom_validator:
+                self.custom_validator(flat)
+            self._check_flat(func_name, flat)
+            return flat
+
+        if self._verdicts is not None and self._matchers:
+            # A cached verdict needs the finished payload for its key, so serialize first
+            # and search (or look up) afterwards instead of scanning during the walk.
+            serialized = deep_serialize(args, max_depth)
+            if self.custom_validator:
+                self.custom_validator(serialized)
+            violation = self._cached_violation(serialized)
+            if violation is not None:
+                raise _blocked(func_name, *violation)
+            return serialized
+
+        matchers = self._matchers
+        scan = _ArgumentScan(matchers)
+        serialized = deep_serialize(args, max_depth, visitor=scan.visit if matchers else None)
+
+        # 1. Custom validator (Top Priority): it still runs before any restricted-argument
+        # hit recorded during the walk is raised.
+        if self.custom_validator:
+            self.custom_validator(serialized)
+
+        # 2. Key-Targeted Recursive Validation. The walk records hits in post-order, while
+        # the reported one is the first hit for the earliest restricted key in pre-order,
+        # so a blocked payload is searched again for that one.
+        if scan.violation is not None:
+            raise _blocked(
+                func_name, *(self._find_violation(serialized, matchers) or scan.violation)
+            )
+        return serialized
@@ -1,53 +1,193 @@
+import random
+import sys
+from collections.abc import Callable, Container, Iterator
 from typing import Any
 
+# A container still being filled: (remaining children, output, is_dict, child depth,
+# ids to release from the current path once its children are done, the key it sits
+# under when its parent is a dict).
+_Frame = tuple[Iterator[Any], Any, bool, int, list[int], str | None]
 
-def deep_serialize(obj: Any, max_depth: int = 10, _seen: set[int] | None = None) -> Any:
+_SCALAR, _SEQUENCE, _MAPPING = 0, 1, 2
+
+# Exact-type dispatch for the builtins that make up nearly every payload: one dict probe
+# instead of an isinstance() chain. Subclasses miss and fall back to _classify().
+_KIND_BY_TYPE: dict[type, int] = {
+    str: _SCALAR,
+    int: _SCALAR,
+    float: _SCALAR,
+    bool: _SCALAR,
+    type(None): _SCALAR,
+    list: _SEQUENCE,
+    tuple: _SEQUENCE,
+    set: _SEQUENCE,
+    dict: _MAPPING,
+}
+
+# Leaves deep_serialize copies through unchanged.
+_SCALAR_TYPES = frozenset({str, int, float, bool, type(None)})
+
+# isinstance() targets, built once: a `str | int | ...` union written inline is a new
+# object constructed on every call.
+_SCALAR_BASES = (str, int, float, bool, type(None))
+_SEQUENCE_BASES = (list, tuple, set)
+_NUMBER_BASES = (int, float)
+
+
+def _classify(obj: Any) -> int | None:
+    """isinstance() fallback for subclasses; None means an arbitrary object."""
+    if isinstance(obj, _SCALAR_BASES):
+        return _SCALAR
+    if isinstance(obj, _SEQUENCE_BASES):
+        return _SEQUENCE
+    if isinstance(obj, dict):
+        return _MAPPING
+    return None
+
+
+def _enter(
+    obj: Any, max_depth: int, seen: set[int], entry_key: str | None = None
+) -> tuple[Any, _Frame | None]:
+    """
+    Serialize `obj` as far as possible without descending into children.
+
+    Returns the serialized value plus, for containers, the frame whose children still
+    have to be filled in. Object wrappers (Pydantic models, __dict__, __slots__) are
+    unwrapped in place, each consuming one level of depth, exactly like a nested call.
     """
-    Recursively attempts to serialize complex objects into primitive dictionaries or lists
+    held: list[int] = []
+    while True:
+        obj_id = id(obj)
+        if obj_id in seen:
+            result: Any = f"<CycleDetected: {type(obj).__name__}>"
+            break
+        if max_depth <= 0:
+            result = f"<MaxDepthReached: {type(obj).__name__}>"
+            break
+        kind = _KIND_BY_TYPE.get(type(obj))
+        if kind is None:
+            kind = _classify(obj)
+        if kind == _SCALAR:
+            result = obj
+            break
+
+        seen.add(obj_id)
+        held.append(obj_id)
+
+        if kind == _SEQUENCE:
+            out_list: list[Any] = []
+            return out_list, (iter(obj), out_list, False, max_depth - 1, held, entry_key)
+        if kind == _MAPPING:
+            out_dict: dict[str, Any] = {}
+            return out_dict, (
+                iter(obj.items()),
+                out_dict,
+                True,
+                max_depth - 1,
+                held,
+                entry_key,
+            )
+
+        # Attempt to handle Pydantic V2 models
+        if hasattr(obj, "model_dump"):
+            obj = obj.model_dump()
+        # Attempt to handle Pydantic V1 / Dataclasses
+        elif hasattr(obj, "dict"):
+            obj = obj.dict()
+        else:
+            try:
+                obj = vars(obj)
+            except TypeError:
+                if not hasattr(obj, "__slots__"):
+                    result = str(obj)
+                    break
+                # Extract slotted attributes, ignoring uninitialized ones
+                obj = {s: getattr(obj, s) for s in obj.__slots__ if hasattr(obj, s)}
+        max_depth -= 1
+
+    for held_id in held:
+        seen.discard(held_id)
+    return result, None
+
+
+def deep_serialize(
+    obj: Any,
+    max_depth: int = 10,
+    _seen: set[int] | None = None,
+    visitor: Callable[[str, Any], None] | None = None,
+) -> Any:
+    """
+    Attempts to serialize complex objects into primitive dictionaries or lists
     for safe HITL analysis and token estimation.
 
     Implements cycle detection and depth limiting to prevent Denial of Service
     from deeply nested or self-referential payloads (like ORM models or DOM trees).
+    The walk is iterative (an explicit stack of child iterators), so it pays no Python
+    frame per node and is not bounded by the interpreter's recursion limit.
+
+    `visitor`, if given, is called as visitor(key, value) for every dict entry of the
+    result as soon as that value is fully serialized, so a policy can inspect the
+    payload during this walk instead of re-traversing the output.
     """
-    if _seen is None:
-        _seen = set()
+    # Ids of the objects on the current path. Membership is what detects a cycle;
+    # ids are released when their subtree is done, which is crucial for allowing
+    # sibling branches to reference the same immutable objects without triggering
+    # a false-positive cycle, while still preventing structural loops. A set rather than
+    # a list scanned along the path: the path is as deep as max_depth, which callers may
+    # raise far beyond the default, and a linear scan per node would turn quadratic.
+    seen = set(_seen) if _seen else set()
 
-    obj_id = id(obj)
-    if obj_id in _seen:
-        return f"<CycleDetected: {type(obj).__name__}>"
+    result, frame = _enter(obj, max_depth, seen)
+    if frame is None:
+        return result
 
-    if max_depth <= 0:
-        return f"<MaxDepthReached: {type(obj).__name__}>"
+    scalar_types = _SCALAR_TYPES
+    stack = [frame]
+    while stack:
+        children, out, is_dict, depth, held, entry_key = stack[-1]
+        # A frame is either a dict or a sequence for its whole life, so each gets its own
+        # loop instead of re-testing is_dict for every child.
+        child_frame = None
+        if is_dict:
+            for key, child in children:
+                str_key = str(key)
+                # Scalars are copied straight through: they are never on the cycle path
+                # and need no _enter() call, only the depth check.
+                if type(child) in scalar_types and depth > 0:
+                    out[str_key] = child
+                    if visitor is not None:
+                        visitor(str_key, child)
+                    continue
+                value, child_frame = _enter(child, depth, seen, str_key)
+                out[str_key] = value
+                if child_frame is not None:
+                    break
+                if visitor is not None:
+                    visitor(str_key, value)
+        else:
+            append = out.append
+            for child in children:
+                if type(child) in scalar_types and depth > 0:
+                    append(child)
+                    continue
+                value, child_frame = _enter(child, depth, seen)
+                append(value)
+                if child_frame is not None:
+                    break
 
-    _seen.add(obj_id)
+        if child_frame is not None:
+            stack.append(child_frame)
+            continue
+        stack.pop()
+        for held_id in held:
+            seen.discard(held_id)
+        if entry_key is not None and visitor is not None:
+            visitor(entry_key, out)
+    return result
 
-    try:
-        if isinstance(obj, str | int | float | bool | type(None)):
-            return obj
-        if isinstance(obj, list | tuple | set):
-            return [deep_serialize(item, max_depth - 1, _seen) for item in obj]
-        if isinstance(obj, dict):
-            return {str(k): deep_serialize(v, max_depth - 1, _seen) for k, v in obj.items()}
 
-        # Attempt to handle Pydantic V2 models
-        if hasattr(obj, "model_dump"):
-            return deep_serialize(obj.model_dump(), max_depth - 1, _seen)
-        # Attempt to handle Pydantic V1 / Dataclasses
-        if hasattr(obj, "dict"):
-            return deep_serialize(obj.dict(), max_depth - 1, _seen)
-
-        try:
-            return deep_serialize(vars(obj), max_depth - 1, _seen)
-        except TypeError:
-            if hasattr(obj, "__slots__"):
-                # Extract slotted attributes, ignoring uninitialized ones
-                slots_dict = {s: getattr(obj, s) for s in obj.__slots__ if hasattr(obj, s)}
-                return deep_serialize(slots_dict, max_depth - 1, _seen)
-            return str(obj)
-    finally:
-        # Crucial for allowing sibling branches to reference the same immutable objects
-        # without triggering a false-positive cycle, while still preventing structural loops.
-        _seen.remove(obj_id)
+# Containers deep_search_dict descends into.
+_SEARCHED = (dict, list)
 
 
 def deep_search_dict(d: Any, target_key: str, max_depth: int = 10) -> list[Any]:
@@ -56,58 +196,221 @@ def deep_search_dict(d: Any, target_key: str, max_depth: int = 10) -> list[Any]:
     This prevents users from burying malicious strings inside **kwargs or nested dicts.
     Implements a strict depth limit.
     """
-    if max_depth <= 0:
-        return []
+    return list(iter_search_dict(d, target_key, max_depth))
+
+
+def iter_search_dict(d: Any, target_key: str, max_depth: int = 10) -> Iterator[Any]:
+    """
+    deep_search_dict() as a generator: each match is yielded as the walk reaches it, so
+    a caller that stops at the first offending value never visits the rest of the tree.
+    """
+    if type(target_key) is str:
+        # Payload keys that are identifiers are interned, so the key test on a match is
+        # then a pointer comparison.
+        target_key = sys.intern(target_key)
+    for _, value in _search_keys(d, (target_key,), max_depth):
+        yield value
+
+
+def _search_keys(
+    d: Any, target_keys: Container[str], max_depth: int = 10
+) -> Iterator[tuple[str, Any]]:
+    """
+    Yield (key, value) for every entry whose key is in `target_keys`, anywhere in the
+    dicts and lists of `d` down to `max_depth`, in depth-first order.
+
+    The walk runs on an explicit stack of iterators, so nesting costs no Python frames
+    and matches keep the order of a recursive search.
+    """
+    if max_depth <= 0 or not isinstance(d, _SEARCHED):
+        return
+
+    searched = _SEARCHED
+    # The container being scanned lives in these locals; its ancestors wait on `parents`
+    # as (remaining entries, is_dict, depth) and resume where they left off.
+    parents: list[tuple[Iterator[Any], bool, int]] = []
+    entries: Iterator[Any] = iter(d.items()) if isinstance(d, dict) else iter(d)
+    is_dict = isinstance(d, dict)
+    depth = max_depth
+    while True:
+        child: Any = None
+        if is_dict:
+            for k, v in entries:
+                if k in target_keys:
+                    yield k, v
+                if isinstance(v, searched) and depth > 1:
+                    child = v
+                    break
+        else:
+            for v in entries:
+                if isinstance(v, searched) and depth > 1:
+                    child = v
+                    break
+
+        if child is not None:
+            parents.append((entries, is_dict, depth))
+            entries = iter(child.items()) if isinstance(child, dict) else iter(child)
+            is_dict = isinstance(child, dict)
+            depth -= 1
+        elif parents:
+            entries, is_dict, depth = parents.pop()
+        else:
+            return
+
+
+# Mixed lists/tuples longer than this can be measured from a sample instead of in full.
+SAMPLE_THRESHOLD = 10_000
+_SAMPLE_SIZE = 64
+# Sampled positions are drawn from the OS: they must not be predictable (or reseedable
+# through the global `random`), or a payload could hide its bulk between them.
+_sampler = random.SystemRandom()
+
+
+def _sample(obj: list[Any] | tuple[Any, ...]) -> list[Any]:
+    """Up to _SAMPLE_SIZE items of a sequence, drawn at random positions."""
+    return _sampler.sample(obj, min(_SAMPLE_SIZE, len(obj)))
+
+
+def _sampled_sequence_len(sample: Any, length: int, sample_threshold: int | None) -> int:
+    """Extrapolate the JSON length of a `length`-item sequence from a serialized sample."""
+    per_item = sum(_char_len(item, sample_threshold) for item in sample) / len(sample)
+    # Brackets + commas + elements
+    return 2 + (length - 1) + int(per_item * length)
 
-    results = []
-    if isinstance(d, dict):
-        for k, v in d.items():
-            if k == target_key:
-                results.append(v)
-            if isinstance(v, dict) or isinstance(v, list):
-                results.extend(deep_search_dict(v, target_key, max_depth - 1))
-    elif isinstance(d, list):
-        for item in d:
-            if isinstance(item, dict) or isinstance(item, list):
-                results.extend(deep_search_dict(item, target_key, max_depth - 1))
 
-    return results
+# JSON lengths of the ints most payloads are made of, read instead of building str(i).
+_SMALL_INT_MIN, _SMALL_INT_MAX = -999, 999
+_SMALL_INT_LEN = tuple(len(str(i)) for i in range(_SMALL_INT_MIN, _SMALL_INT_MAX + 1))
 
 
-def estimate_tokens_safely(serialized_obj: Any) -> int:
+def _leaf_len(obj: Any) -> int | None:
+    """_char_len() of an exact str/int/bool/None/float, or None for anything else."""
+    kind = type(obj)
+    if kind is str:
+        # Quotes + length + escaping heuristics (approximate)
+        return len(obj) + 2
+    if kind is int:
+        if _SMALL_INT_MIN <= obj <= _SMALL_INT_MAX:
+            index: int = obj - _SMALL_INT_MIN
+            return _SMALL_INT_LEN[index]
+        return len(str(obj))
+    if kind is bool:
+        return 4 if obj else 5
+    if obj is None:
+        return 4
+    if kind is float:
+        return len(str(obj))
+    return None
+
+
+# Scalars whose repr() is exactly as long as their JSON form (True/true, None/null, ...).
+_REPR_SIZED_TYPES = frozenset({int, float, bool, type(None)})
+# Sequences at least this long are checked for a single element type first.
+_HOMOGENEOUS_MIN = 64
+# Slice size for measuring numeric sequences through repr() in bounded memory.
+_REPR_SLICE = 4096
+
+
+def _homogeneous_len(obj: list[Any] | tuple[Any, ...], n: int) -> int | None:
+    """
+    Element lengths of a sequence made only of strings, or only of numbers, bools and
+    None, summed in C-level loops instead of per item. None for mixed sequences.
+    """
+    kinds = set(map(type, obj))
+    if kinds == {str}:
+        # Each string is its length plus two quotes.
+        return sum(map(len, obj)) + 2 * n
+    if kinds <= _REPR_SIZED_TYPES:
+        # repr() of a k-item list is its elements, k-1 ", " separators and the brackets,
+        # so the elements alone are len(repr) - 2k. Slicing keeps each string small.
+        total = 0
+        for start in range(0, n, _REPR_SLICE):
+            chunk = list(obj[start : start + _REPR_SLICE])
+            total += len(repr(chunk)) - 2 * len(chunk)
+        return total
+    return None
+
+
+def _char_len(obj: Any, sample_threshold: int | None = None) -> int:
+    """JSON byte-length of an already-serialized object, computed without rendering it."""
+    leaf = _leaf_len(obj)
+    if leaf is not None:
+        return leaf
+    if isinstance(obj, str):
+        # Quotes + length + escaping heuristics (approximate)
+        return len(obj) + 2
+    elif isinstance(obj, _NUMBER_BASES):
+        return len(str(obj))
+    elif isinstance(obj, _SEQUENCE_BASES):
+        n = len(obj)
+        if not n:
+            return 2  # "[]"
+        # Brackets + commas + elements. Strings, the most common element, are measured
+        # inline; other scalars without recursing.
+        total = 2 + (n - 1)
+        if n >= _HOMOGENEOUS_MIN and not isinstance(obj, set):
+            # Always exact, even past sample_threshold: it runs in C anyway.
+            elements = _homogeneous_len(obj, n)
+            if elements is not None:
+                return total + elements
+            if sample_threshold is not None and n > sample_threshold:
+                return _sampled_sequence_len(_sample(obj), n, sample_threshold)
+        for item in obj:
+            if type(item) is str:
+                total += len(item) + 2
+                continue
+            leaf = _leaf_len(item)
+            total += leaf if leaf is not None else _char_len(item, sample_threshold)
+        return total
+    elif isinstance(obj, dict):
+        if not obj:
+            return 2  # "{}"
+        # Braces + (quotes+colon+comma) overhead per kv pair + lengths
+        total = 2 + (len(obj) - 1)  # braces and commas
+        for k, v in obj.items():
+            # "key": value
+            total += (len(k) if type(k) is str else len(str(k))) + 3
+            if type(v) is str:
+                total += len(v) + 2
+                continue
+            leaf = _leaf_len(v)
+            total += leaf if leaf is not None else _char_len(v, sample_threshold)
+        return total
+    else:
+        # Fallback for unrecognized types (should be caught by deep_serialize first)
+        return len(str(obj)) + 2
+
+
+def estimate_tokens_safely(serialized_obj: Any, sample_threshold: int | None = None) -> int:
     """
     Deterministically computes the exact byte-length of the object if it were
     serialized to JSON, without ever allocating the monolithic string in memory.
     This guarantees 0(1) memory overhead and prevents OOM crashes on massive payloads.
     Roughly 1 token per 4 bytes of data.
+
+    With `sample_threshold`, mixed or nested lists and tuples longer than it are
+    extrapolated from ~64 items at random positions, at the cost of exactness. Sequences
+    of only strings or only numbers are always measured exactly.
     """
+    return max(1, _char_len(serialized_obj, sample_threshold) // 4)
 
-    def _char_len(obj: Any) -> int:
-        if isinstance(obj, str):
-            # Quotes + length + escaping heuristics (approximate)
-            return len(obj) + 2
-        elif isinstance(obj, int | float):
-            return len(str(obj))
-        elif isinstance(obj, bool):
-            return 4 if obj else 5
-        elif obj is None:
-            return 4
-        elif isinstance(obj, list | tuple | set):
-            if not obj:
-                return 2  # "[]"
-            # Brackets + commas + elements
-            return 2 + (len(obj) - 1) + sum(_char_len(item) for item in obj)
-        elif isinstance(obj, dict):
-            if not obj:
-                return 2  # "{}"
-            # Braces + (quotes+colon+comma) overhead per kv pair + lengths
-            total = 2 + (len(obj) - 1)  # braces and commas
-            for k, v in obj.items():
-                total += len(str(k)) + 3 + _char_len(v)  # "key": value
-            return total
-        else:
-            # Fallback for unrecognized types (should be caught by deep_serialize first)
-            return len(str(obj)) + 2
 
-    byte_size = _char_len(serialized_obj)
-    return max(1, byte_size // 4)
+def estimate_tokens_from_raw(obj: Any, sample_threshold: int = SAMPLE_THRESHOLD) -> int:
+    """
+    Serialize-and-estimate for a raw (not yet serialized) object.
+
+    A top-level list or tuple longer than `sample_threshold` is never serialized in
+    full: scalars serialize to themselves, so a sequence of only strings or only
+    numbers is measured exactly as it is, and a mixed one from a random sample, which
+    is what keeps metering a multi-million item result from walking every item twice.
+    """
+    if type(obj) in (list, tuple) and len(obj) > sample_threshold:
+        n = len(obj)
+        elements = _homogeneous_len(obj, n)
+        if elements is not None:
+            return max(1, (2 + (n - 1) + elements) // 4)
+        # The sequence itself counts as being on the path so a self-reference in the
+        # sample is still reported as a cycle, as in a full serialization.
+        sample = deep_serialize(_sample(obj), _seen={id(obj)})
+        return max(1, _sampled_sequence_len(sample, n, sample_threshold) // 4)
+    return estimate_tokens_safely(deep_serialize(obj), sample_threshold)